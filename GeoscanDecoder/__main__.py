@@ -2,16 +2,24 @@ import argparse
 import configparser
 import sys
 
-from GeoscanDecoder import CONFIG, HOMEDIR, ui
+from GeoscanDecoder import CONFIG, HOMEDIR
 from GeoscanDecoder.version import __version__
 
 
 if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        # post-processing workers of the frozen app start the executable again
+        import multiprocessing
+
+        multiprocessing.freeze_support()
+
     cp = configparser.ConfigParser()
     cp.read_dict({'main': {'ip': '127.0.0.1',
                            'port': '8000',
+                           'servers': '',
                            'outdir': str(HOMEDIR),
-                           'merge mode': 'off'},
+                           'merge mode': 'off',
+                           'db': ''},
                   'info': {'version': __version__}})
     cp.read(CONFIG)
 
@@ -19,24 +27,88 @@ if __name__ == '__main__':
 
     ap.add_argument('--server', default=cp.get('main', 'ip'), help='Soundmodem connection IP')
     ap.add_argument('--port', default=cp.get('main', 'port'), help='Soundmodem connection port')
+    ap.add_argument('--servers', default=cp.get('main', 'servers'),
+                    help='Comma separated soundmodems host:port to receive at once (console only)')
     ap.add_argument('--outdir', default=cp.get('main', 'outdir'), help='Directory to store received data')
     ap.add_argument('--merge', default=cp.get('main', 'merge mode'), help='Store all new images data to one file')
+    ap.add_argument('--dedup', action='store_true',
+                    help='Drop frames repeated within 2 minutes, e.g. heard by several soundmodems')
+    ap.add_argument('--db', default=cp.get('main', 'db'), help='Also store telemetry to this SQLite database')
     ap.add_argument('--ui', help='Run in GUI', action='store_true')
+    ap.add_argument('--ui-rate', default=10.0, type=float, help='Max GUI refresh rate, Hz, 0 - no limit')
+    ap.add_argument('--record', help='Record raw soundmodem stream to capture file')
+    ap.add_argument('--replay', help='Decode capture file instead of soundmodem connection (console only)')
+    ap.add_argument('--speed', default=1.0, type=float, help='Replay speed, 0 - as fast as possible')
+    ap.add_argument('--publish', metavar='[udp://]HOST:PORT',
+                    help='Publish decoded telemetry and image progress as JSON lines to TCP subscribers '
+                         '(or UDP datagrams)')
+    ap.add_argument('--postprocess', metavar='JOBS', nargs='?', const=2, default=0, type=int,
+                    help='Make thumbnails, PNG and metadata of saved images in JOBS worker processes')
+    ap.add_argument('--fsync', default='image', choices=('off', 'image', 'batch'),
+                    help='When received data is synced to disk: never, on every saved image, on every write batch')
+    ap.add_argument('--profile', action='store_true',
+                    help='Time the decoding stages and print a report on exit')
+    ap.add_argument('--profile-cpu', metavar='FILE', help='Also run cProfile and save the stats to FILE (slow)')
+    ap.add_argument('--profile-mem', metavar='DEPTH', nargs='?', const=1, default=0, type=int,
+                    help='Also trace memory allocations with tracemalloc (slow)')
+    ap.add_argument('--metrics', metavar='[HOST:]PORT', help='Serve decoder metrics for Prometheus over HTTP')
 
     args = ap.parse_args()
+    if args.ui_rate < 0:
+        ap.error('--ui-rate must not be negative')
+    if args.record and args.replay:
+        ap.error('--record can\'t be used with --replay')
+    if args.servers:
+        from GeoscanDecoder.ingest import parse_endpoints
+
+        try:
+            parse_endpoints(args.servers)
+        except argparse.ArgumentTypeError as e:
+            ap.error(f'--servers: {e}')
     cp.set('main', 'ip', args.server or '127.0.0.1')
     cp.set('main', 'port', args.port or '8000')
+    cp.set('main', 'servers', args.servers or '')
     cp.set('main', 'outdir', str(args.outdir) or str(HOMEDIR))
     cp.set('main', 'merge mode', args.merge or 'off')
+    cp.set('main', 'db', args.db or '')
 
     frozen = getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
 
+    if args.metrics:
+        from GeoscanDecoder import metrics
+
+        metrics.serve(args.metrics)
+
+    profiler = None
+    if args.profile or args.profile_cpu or args.profile_mem:
+        from GeoscanDecoder.profiling import Profiler
+
+        profiler = Profiler(args.profile_cpu, args.profile_mem)
+
     if args.ui or frozen:
-        app = ui.App(cp)
+        from GeoscanDecoder import ui
+
+        app = ui.App(cp, record=args.record, render_rate=args.ui_rate, publish=args.publish,
+                     postprocess=args.postprocess, fsync=args.fsync, dedup=args.dedup)
+        if profiler:
+            profiler.instrument(app.pipeline)
+            profiler.instrument_ui(app)
+            profiler.start()
         app.mainloop()
     else:
-        print('Console version not supported yet', file=sys.stderr)
-        sys.exit(-1)
+        from GeoscanDecoder import console
+
+        c = console.Console(cp, record=args.record, replay=args.replay, speed=args.speed, publish=args.publish,
+                            postprocess=args.postprocess, fsync=args.fsync, dedup=args.dedup)
+        if profiler:
+            profiler.instrument(c.pipeline)
+            profiler.start()
+        c.run()
+
+    if profiler:
+        profiler.stop()
+        profiler.report()
 
+    CONFIG.parent.mkdir(parents=True, exist_ok=True)
     with CONFIG.open('w') as cf:
         cp.write(cf)
@@ -0,0 +1,94 @@
+import collections
+import struct
+
+from GeoscanDecoder import metrics
+
+
+# AGWPE header: port, 3 reserved, DataKind, reserved, PID, reserved,
+# CallFrom[10], CallTo[10], DataLen (LE), User (reserved)
+AGWPE_HDR = struct.Struct('<B3xcxBx10s10sI4x')
+
+
+class AGWPEFrame(collections.namedtuple('AGWPEFrame', 'port kind pid call_from call_to data')):
+    __slots__ = ()
+
+    @property
+    def ax25(self):
+        # raw monitored frame ('K'): one byte of KISS port/command before the AX.25 frame
+        return self.data[1:]
+
+
+class AGWPEFramer:
+    HDR_SZ = AGWPE_HDR.size
+    MAX_DATA_LEN = 0x10000
+    RECV_SZ = 4096
+
+    def __init__(self, bufsize=0x10000, tap=None):
+        # tap: callable getting every chunk of the raw stream, e.g. CaptureWriter.write
+        self.tap = tap
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._head = self._tail = 0
+        self.errors = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def reset(self):
+        self._head = self._tail = 0
+
+    def _reserve(self, n):
+        if self._tail + n <= len(self._buf):
+            return
+
+        pending = self._tail - self._head
+        if pending + n > len(self._buf):
+            # frames handed out earlier keep referencing the old buffer
+            buf = bytearray(max(len(self._buf) * 2, pending + n))
+            view = memoryview(buf)
+            view[:pending] = self._view[self._head:self._tail]
+            self._buf, self._view = buf, view
+        else:
+            self._view[:pending] = self._view[self._head:self._tail]
+        self._head, self._tail = 0, pending
+
+    def recv_into(self, sock):
+        self._reserve(self.RECV_SZ)
+        n = sock.recv_into(self._view[self._tail:])
+        metrics.BYTES_READ.inc(n)
+        if n and self.tap:
+            self.tap(self._view[self._tail:self._tail + n])
+        self._tail += n
+        return n
+
+    def feed(self, data):
+        n = len(data)
+        if n and self.tap:
+            self.tap(data)
+        self._reserve(n)
+        self._view[self._tail:self._tail + n] = data
+        self._tail += n
+
+    def frames(self):
+        # yielded data is a view into the internal buffer, valid until the next feed/recv_into
+        while self._tail - self._head >= self.HDR_SZ:
+            port, kind, pid, call_from, call_to, dlen = AGWPE_HDR.unpack_from(self._buf, self._head)
+            if dlen > self.MAX_DATA_LEN:
+                # stream desynchronized, drop everything buffered
+                self.errors += 1
+                self.reset()
+                return
+
+            start = self._head + self.HDR_SZ
+            end = start + dlen
+            if end > self._tail:
+                return
+
+            self._head = end
+            yield AGWPEFrame(port, kind, pid,
+                             call_from.split(b'\x00', 1)[0].decode('ascii', 'replace'),
+                             call_to.split(b'\x00', 1)[0].decode('ascii', 'replace'),
+                             self._view[start:end])
+
+        if self._head == self._tail:
+            self._head = self._tail = 0
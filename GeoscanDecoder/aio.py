@@ -0,0 +1,136 @@
+import asyncio
+
+from GeoscanDecoder import AGWPE_CON, metrics
+from GeoscanDecoder.agwpe import AGWPEFramer
+
+
+class AGWPEClient:
+    # asyncio soundmodem connection, an async iterator of AGWPEFrame.
+    # Reconnects with exponential backoff; when the queue is full the socket is not read,
+    # so a slow consumer slows the stream down instead of losing frames.
+    #
+    #   async with AGWPEClient('127.0.0.1', 8000) as c:
+    #       async for frame in c:
+    #           ...
+    #
+    # Several consumers iterating the same client share its frames.
+    RECV_SZ = 4096
+
+    def __init__(self, host='127.0.0.1', port=8000, maxsize=256, kinds=(b'K',),
+                 min_delay=1.0, max_delay=60.0, log=None):
+        self.host = host
+        self.port = int(port)
+        self.name = f'{host}:{port}'
+        self.maxsize = maxsize
+        self.kinds = kinds
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.log = log or (lambda msg: None)
+        self.queue = None
+        self.connects = 0
+        self.frames = 0
+        self.bytes = 0
+        self._task = None
+        self._writer = None
+        self._closed = False
+
+    def start(self):
+        # must be called from the running loop
+        if not self._task:
+            self.queue = asyncio.Queue(self.maxsize)
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def close(self):
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        self.start()
+        return self
+
+    async def __anext__(self):
+        frame = await self.queue.get()
+        if frame is None:
+            # let the other consumers see the end too
+            self.queue.put_nowait(None)
+            raise StopAsyncIteration
+        return frame
+
+    async def _run(self):
+        delay = self.min_delay
+        try:
+            while not self._closed:
+                try:
+                    reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                    self._writer.write(AGWPE_CON)
+                    await self._writer.drain()
+                except OSError as e:
+                    self.log(f'Connection to {self.name} failed: {e.strerror or e}, retry in {delay:g} s')
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_delay)
+                    continue
+
+                self.connects += 1
+                delay = self.min_delay
+                self.log(f'Connected to {self.name}')
+                try:
+                    await self._read(reader)
+                    msg = 'Connection lost'
+                except OSError as e:
+                    msg = f'Connection error: {e.strerror or e}'
+                finally:
+                    self._writer.close()
+                    self._writer = None
+
+                self.log(f'{self.name}: {msg}, reconnect in {delay:g} s')
+                await asyncio.sleep(delay)
+        finally:
+            # wake up the consumers, dropping a frame if there is no room for the end mark
+            while 1:
+                try:
+                    self.queue.put_nowait(None)
+                    break
+                except asyncio.QueueFull:
+                    self.queue.get_nowait()
+
+    async def _read(self, reader):
+        framer = AGWPEFramer()
+        while 1:
+            data = await reader.read(self.RECV_SZ)
+            if not data:
+                return
+
+            self.bytes += len(data)
+            metrics.BYTES_READ.inc(len(data))
+            framer.feed(data)
+            for frame in framer.frames():
+                if self.kinds and frame.kind not in self.kinds:
+                    continue
+                self.frames += 1
+                # frame data is a view into the framer buffer, keep a copy while queued
+                await self.queue.put(frame._replace(data=bytes(frame.data)))
+
+    def stats(self):
+        return f'{self.name}: {self.frames} frames, {self.bytes} bytes, {self.connects} connects'
+
+
+async def decode(client, pipeline):
+    # (telemetry, telemetry log path, image receiver result) of the monitored frames
+    async for frame in client:
+        if frame.kind == b'K':
+            yield pipeline.process(frame.ax25)
+            if pipeline.writer and pipeline.writer.behind:
+                # wait for the disk in a thread, the loop serves the other sources meanwhile
+                await asyncio.get_running_loop().run_in_executor(None, pipeline.wait_output)
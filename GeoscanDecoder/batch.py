@@ -0,0 +1,99 @@
+import construct
+import numpy as np
+
+from GeoscanDecoder.agwpe import AGWPEFramer
+from GeoscanDecoder.capture import read_stream
+from GeoscanDecoder.geoscan import geoscan_frame, MulAdapter, SubAdapter, UNIXTimestampAdapter
+
+
+# AX.25 allows up to 10 addresses (source, destination and 8 digipeaters)
+MAX_ADDRESSES = 10
+_BEACON = np.frombuffer(b'BEACON', np.uint8)
+
+
+def _layout():
+    # raw and decoded dtypes with column conversions, taken from `geoscan_frame`
+    raw, out, conv = [], [], []
+    for sc in geoscan_frame.subcons:
+        a = sc.subcon
+        field = a.subcon if isinstance(a, construct.Adapter) else a
+        if not isinstance(field, construct.FormatField):
+            continue
+
+        # struct and numpy disagree on the size of 'L', so spell out the integer width
+        fmt = field.fmtstr[0] + ('i' if field.fmtstr[1].islower() else 'u') + str(field.length)
+        raw.append((sc.name, fmt))
+        if isinstance(a, UNIXTimestampAdapter):
+            out.append((sc.name, 'datetime64[s]'))
+            conv.append((sc.name, lambda x: x.astype('datetime64[s]')))
+        elif isinstance(a, MulAdapter):
+            out.append((sc.name, 'f8'))
+            conv.append((sc.name, lambda x, v=a.v: x.astype(np.float64) * v))
+        elif isinstance(a, SubAdapter):
+            out.append((sc.name, 'i4'))
+            conv.append((sc.name, lambda x, v=a.v: x.astype(np.int32) - v))
+        else:
+            out.append((sc.name, fmt))
+            conv.append((sc.name, None))
+
+    return np.dtype(raw), np.dtype(out), conv
+
+
+RAW_DTYPE, TLM_DTYPE, _CONV = _layout()
+
+
+def _pack(frames, width):
+    # frames -> (n, width) zero padded uint8 matrix and lengths
+    n = len(frames)
+    lens = np.fromiter(map(len, frames), np.int64, n)
+    flat = np.frombuffer(b''.join(frames), np.uint8)
+    clen = np.minimum(lens, width)
+    rows = np.repeat(np.arange(n), clen)
+    cols = np.arange(int(clen.sum())) - np.repeat(np.cumsum(clen) - clen, clen)
+
+    buf = np.zeros((n, width), np.uint8)
+    buf[rows, cols] = flat[np.repeat(np.cumsum(lens) - lens, clen) + cols]
+    return buf, lens
+
+
+def decode_frames(frames):
+    # returns structured array of `geoscan_frame` fields and a mask of non telemetry rows
+    frames = [bytes(f) for f in frames]
+    n = len(frames)
+    if not n:
+        return np.zeros(0, TLM_DTYPE), np.zeros(0, bool)
+
+    buf, lens = _pack(frames, MAX_ADDRESSES * 7 + 2 + RAW_DTYPE.itemsize)
+
+    # header length from the first address with extension bit set
+    ext = (buf[:, 6:MAX_ADDRESSES * 7:7] & 1).astype(bool)
+    hdr = (ext.argmax(axis=1) + 1) * 7 + 2
+    valid = (ext.any(axis=1)
+             & (lens >= hdr + RAW_DTYPE.itemsize)
+             & ((buf[:, :6] >> 1) == _BEACON).all(axis=1)
+             & (buf[np.arange(n), np.minimum(hdr, buf.shape[1]) - 1] == 0xF0))
+
+    idx = hdr[:, None] + np.arange(RAW_DTYPE.itemsize)
+    raw = buf[np.arange(n)[:, None], np.minimum(idx, buf.shape[1] - 1)]
+    raw[~valid] = 0
+    raw = np.ascontiguousarray(raw).view(RAW_DTYPE).reshape(n)
+
+    out = np.empty(n, TLM_DTYPE)
+    for name, fn in _CONV:
+        out[name] = fn(raw[name]) if fn else raw[name]
+
+    return out, ~valid
+
+
+def read_agwpe(fp):
+    # AX.25 payloads of monitored frames from a capture file or a raw AGWPE stream dump
+    framer = AGWPEFramer()
+    frames = []
+    for _, chunk in read_stream(fp):
+        framer.feed(chunk)
+        frames.extend(bytes(fr.ax25) for fr in framer.frames() if fr.kind == b'K')
+    return frames
+
+
+def decode_file(fp):
+    return decode_frames(read_agwpe(fp))
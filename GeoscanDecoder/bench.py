@@ -0,0 +1,263 @@
+import argparse
+import datetime as dt
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import construct
+import PIL.Image
+
+from GeoscanDecoder.agwpe import AGWPE_HDR, AGWPEFramer
+from GeoscanDecoder.geoscan import (ax25_header, geoscan, geoscan_frame, parse_frame, parse_tlm, _frame,
+                                    GeoscanImageReceiver)
+from GeoscanDecoder.pipeline import Pipeline
+from GeoscanDecoder.version import __version__
+
+
+CHUNK_SZ = 56   # image data bytes in a frame, as sent by the satellite
+IMG_BASE = 4096
+
+
+def _addr(callsign, last):
+    return construct.Container(callsign=callsign, ssid=construct.Container(ch=False, ssid=0, extension=last))
+
+
+def make_header(src='RS20S', dst='BEACON', pid=0xF0):
+    return ax25_header.build(construct.Container(addresses=[_addr(dst, False), _addr(src, True)],
+                                                 control=0x03, pid=pid))
+
+
+def make_tlm(t, rnd):
+    return make_header() + geoscan_frame.build(construct.Container(
+        time=dt.datetime.utcfromtimestamp(t),
+        Iab=rnd.uniform(0, 1000),
+        Isp=rnd.uniform(0, 500),
+        Uab_per=rnd.uniform(3.5, 4.2),
+        Uab_sum=rnd.uniform(7.0, 8.4),
+        Tx_plus=rnd.randrange(256),
+        Tx_minus=rnd.randrange(256),
+        Ty_plus=rnd.randrange(256),
+        Ty_minus=rnd.randrange(256),
+        Tz_plus=rnd.randrange(256),
+        Tz_minus=rnd.randrange(256),
+        Tab1=rnd.randrange(256),
+        Tab2=rnd.randrange(256),
+        CPU_load=rnd.randrange(101),
+        Nres_osc=rnd.randrange(100),
+        Nres_CommU=rnd.randrange(100),
+        RSSI=-rnd.randrange(60, 99),
+        pad=bytes(20),
+    ))
+
+
+def make_jpeg(rnd, size=(320, 240)):
+    # smooth random picture, about the size of a real one
+    w, h = size[0] // 8, size[1] // 8
+    noise = rnd.getrandbits(8 * w * h * 3).to_bytes(w * h * 3, 'little')
+    img = PIL.Image.frombytes('RGB', (w, h), noise).resize(size, PIL.Image.BICUBIC)
+    b = io.BytesIO()
+    img.save(b, 'JPEG', quality=75)
+    return b.getvalue()
+
+
+def make_chunks(jpg, base=IMG_BASE, subsystem=1):
+    out = []
+    for n, off in enumerate(range(0, len(jpg), CHUNK_SZ)):
+        d = jpg[off:off + CHUNK_SZ]
+        out.append(_frame.build(construct.Container(
+            marker=GeoscanImageReceiver.MARKER_IMG,
+            dlen=len(d) + 6,
+            mtype=GeoscanImageReceiver.CMD_IMG_START if not n else GeoscanImageReceiver.CMD_IMG_FRAME,
+            offset=base + off,
+            subsystem_num=subsystem,
+            data=d,
+        )))
+    return out
+
+
+def make_agwpe(ax25):
+    data = b'\0' + ax25
+    return AGWPE_HDR.pack(0, b'K', 0xF0, b'RS20S', b'BEACON', len(data)) + data
+
+
+def make_stream(n_tlm=200, seed=1):
+    # telemetry frames with a full JPEG split into chunks interleaved, as in a pass
+    rnd = random.Random(seed)
+    tlm = [make_tlm(1690000000 + i, rnd) for i in range(n_tlm)]
+    jpg = make_jpeg(rnd)
+    chunks = make_chunks(jpg)
+    mixed = list(chunks)
+    for i, f in enumerate(tlm):
+        mixed.insert(i * len(chunks) // len(tlm) + i, f)
+    return tlm, chunks, mixed, jpg
+
+
+def _timeit(fn, n, repeat, min_time):
+    # best of `repeat` rounds, a round is repeated until it takes at least `min_time`
+    best = None
+    for _ in range(repeat):
+        loops = 0
+        t0 = time.perf_counter()
+        while 1:
+            fn()
+            loops += 1
+            dt_ = time.perf_counter() - t0
+            if dt_ >= min_time:
+                break
+        per_frame = dt_ / (loops * n)
+        best = per_frame if best is None else min(best, per_frame)
+    return best
+
+
+def benchmarks(n_tlm=200, seed=1):
+    tlm, chunks, mixed, jpg = make_stream(n_tlm, seed)
+    agw = b''.join(make_agwpe(f) for f in mixed)
+    tmp = tempfile.TemporaryDirectory(prefix='geoscan-bench-')
+
+    def construct_parse():
+        for f in tlm:
+            geoscan.parse(f)
+
+    def fast_parse():
+        for f in tlm:
+            parse_tlm(f)
+
+    def construct_frame_parse():
+        for f in chunks:
+            _frame.parse(f)
+
+    def fast_frame_parse():
+        for f in chunks:
+            parse_frame(f)
+
+    ir = GeoscanImageReceiver(tmp.name)
+
+    def parse_data():
+        for f in chunks:
+            ir.parse_data(f)
+
+    def push_data():
+        for f in chunks:
+            ir.push_data(f)
+
+    pipeline = Pipeline(tmp.name)
+    framer = AGWPEFramer()
+
+    def end_to_end():
+        framer.feed(agw)
+        for _ in pipeline.process_frames(framer):
+            pass
+
+    def cleanup():
+        ir.close()
+        pipeline.close()
+        tmp.cleanup()
+
+    return [
+        ('geoscan.parse', len(tlm), construct_parse),
+        ('parse_tlm', len(tlm), fast_parse),
+        ('_frame.parse', len(chunks), construct_frame_parse),
+        ('parse_frame', len(chunks), fast_frame_parse),
+        ('GeoscanImageReceiver.parse_data', len(chunks), parse_data),
+        ('GeoscanImageReceiver.push_data', len(chunks), push_data),
+        ('end_to_end', len(mixed), end_to_end),
+    ], {'tlm_frames': len(tlm), 'img_frames': len(chunks), 'jpeg_bytes': len(jpg)}, cleanup
+
+
+# startup cost of the modules loaded before the first frame can be decoded
+IMPORTS = ('GeoscanDecoder.console', 'GeoscanDecoder.ui')
+
+
+def import_time(module, repeat=5):
+    # best cold import time in a fresh interpreter, ms; None if the module can't be imported
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    best = None
+    for _ in range(repeat):
+        r = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if r.returncode:
+            return
+        t = float(r.stdout) * 1e3
+        best = t if best is None else min(best, t)
+    return best
+
+
+def run(n_tlm=200, repeat=5, min_time=0.2, only=None, seed=1):
+    benches, info, cleanup = benchmarks(n_tlm, seed)
+    results = {}
+    try:
+        for name, n, fn in benches:
+            if only and not any(x in name for x in only):
+                continue
+            t = _timeit(fn, n, repeat, min_time)
+            results[name] = {'frames': n, 'us_per_frame': t * 1e6, 'frames_per_sec': 1 / t}
+    finally:
+        cleanup()
+
+    imports = {}
+    for m in IMPORTS:
+        if only and not any(x in f'import {m}' for x in only):
+            continue
+        t = import_time(m, repeat)
+        if t is not None:
+            imports[m] = {'ms': t}
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'construct': construct.__version__,
+        'date': dt.datetime.now().isoformat(timespec='seconds'),
+        'params': dict(info, repeat=repeat, min_time=min_time, seed=seed),
+        'results': results,
+        'imports': imports,
+    }
+
+
+def report(res, base=None, file=sys.stdout):
+    print(f'GeoscanDecoder {res["version"]}, Python {res["python"]} ({res["implementation"]}, {res["machine"]})',
+          file=file)
+    for name, r in res['results'].items():
+        line = f'{name:34} {r["us_per_frame"]:10.2f} us/frame {r["frames_per_sec"]:12.0f} frames/s'
+        old = base and base['results'].get(name)
+        if old:
+            line += f'  x{old["us_per_frame"] / r["us_per_frame"]:.2f} vs {base["version"]}'
+        print(line, file=file)
+    for name, r in res.get('imports', {}).items():
+        line = f'{"import " + name:34} {r["ms"]:10.2f} ms'
+        old = base and base.get('imports', {}).get(name)
+        if old:
+            line += f'  x{old["ms"] / r["ms"]:.2f} vs {base["version"]}'
+        print(line, file=file)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Measure decoder throughput on generated frames')
+    ap.add_argument('--tlm', default=200, type=int, help='Telemetry frames in the stream')
+    ap.add_argument('--repeat', default=5, type=int, help='Rounds per benchmark, the best one is taken')
+    ap.add_argument('--min-time', default=0.2, type=float, help='Minimal duration of a round, s')
+    ap.add_argument('--seed', default=1, type=int, help='Random seed of the generated stream')
+    ap.add_argument('--only', nargs='*', help='Run only benchmarks with these substrings in name')
+    ap.add_argument('--json', help='Write results as JSON to this file, "-" for stdout')
+    ap.add_argument('--compare', help='JSON results of a previous run to compare with')
+    args = ap.parse_args()
+
+    res = run(args.tlm, args.repeat, args.min_time, args.only, args.seed)
+    base = None
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+
+    if args.json == '-':
+        json.dump(res, sys.stdout, indent=2)
+        print()
+    else:
+        report(res, base)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(res, f, indent=2)
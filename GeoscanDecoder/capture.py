@@ -0,0 +1,177 @@
+import pathlib
+import socket as sk
+import struct
+import threading
+import time
+
+
+MAGIC = b'GSCAP\x00\x01\n'
+# record: arrival time (unix), chunk length, chunk as read from the soundmodem socket
+_REC = struct.Struct('<dI')
+
+
+class CaptureWriter:
+    def __init__(self, fp):
+        self.path = pathlib.Path(fp).expanduser().absolute()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open('ab')
+        if not self._f.tell():
+            self._f.write(MAGIC)
+
+    def write(self, data, t=None):
+        self._f.write(_REC.pack(t or time.time(), len(data)))
+        self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def is_capture(fp):
+    with open(fp, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_capture(fp):
+    with open(fp, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{fp}: not a capture file')
+
+        while 1:
+            hdr = f.read(_REC.size)
+            if len(hdr) < _REC.size:
+                return
+            t, n = _REC.unpack(hdr)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield t, data
+
+
+def read_stream(fp):
+    # (arrival time or None, chunk) of a capture file or a raw AGWPE stream dump
+    if is_capture(fp):
+        yield from read_capture(fp)
+        return
+
+    with open(fp, 'rb') as f:
+        while 1:
+            chunk = f.read(0x10000)
+            if not chunk:
+                return
+            yield None, chunk
+
+
+class CaptureSocket:
+    # socket-like capture player for the code reading soundmodem with recv_into().
+    # speed: 1 - real time, N - N times faster, 0 - as fast as possible
+    def __init__(self, fp, speed=1.0):
+        self.speed = speed
+        self.timeout = None
+        self._it = read_capture(fp)
+        self._pending = memoryview(b'')
+        self._next = None
+        self._t0 = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, data):
+        return len(data)
+
+    def recv_into(self, buf):
+        if not self._pending:
+            if not self._next:
+                self._next = next(self._it, None)
+                if not self._next:
+                    return 0
+
+            t, data = self._next
+            self._wait(t)
+            self._pending = memoryview(data)
+            self._next = None
+
+        n = min(len(buf), len(self._pending))
+        buf[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _wait(self, t):
+        if not self.speed:
+            return
+
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = t, now
+            return
+
+        delay = self._t0[1] + (t - self._t0[0]) / self.speed - now
+        if delay <= 0:
+            return
+        if self.timeout is not None and delay > self.timeout:
+            time.sleep(self.timeout)
+            raise sk.timeout('timed out')
+        time.sleep(delay)
+
+    def close(self):
+        self._it.close()
+
+
+class ReplayServer(threading.Thread):
+    # fake soundmodem AGWPE server, plays the capture to every connected client
+    def __init__(self, fp, speed=1.0, host='127.0.0.1', port=8000):
+        super().__init__(daemon=True)
+        self.fp = fp
+        self.speed = speed
+        self.srv = sk.socket(sk.AF_INET, sk.SOCK_STREAM)
+        self.srv.setsockopt(sk.SOL_SOCKET, sk.SO_REUSEADDR, 1)
+        self.srv.bind((host, port))
+        self.srv.listen()
+        self.address = self.srv.getsockname()
+
+    def run(self):
+        while 1:
+            try:
+                c, _ = self.srv.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(c,), daemon=True).start()
+
+    def _serve(self, c):
+        src = CaptureSocket(self.fp, self.speed)
+        buf = bytearray(0x10000)
+        try:
+            with c:
+                while 1:
+                    n = src.recv_into(buf)
+                    if not n:
+                        break
+                    c.sendall(memoryview(buf)[:n])
+        except OSError:
+            pass
+        finally:
+            src.close()
+
+    def close(self):
+        self.srv.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description='Replay recorded soundmodem stream as AGWPE server')
+    ap.add_argument('capture', help='Capture file')
+    ap.add_argument('--host', default='127.0.0.1', help='Listen address')
+    ap.add_argument('--port', default=8000, type=int, help='Listen port')
+    ap.add_argument('--speed', default=1.0, type=float, help='Playback speed, 0 - as fast as possible')
+    args = ap.parse_args()
+
+    srv = ReplayServer(args.capture, args.speed, args.host, args.port)
+    print(f'Serving {args.capture} on {srv.address[0]}:{srv.address[1]}')
+    srv.start()
+    try:
+        srv.join()
+    except KeyboardInterrupt:
+        srv.close()
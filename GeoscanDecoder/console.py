@@ -0,0 +1,116 @@
+import pathlib
+import signal
+import socket as sk
+import sys
+
+from GeoscanDecoder.agwpe import AGWPEFramer
+from GeoscanDecoder.capture import CaptureSocket, CaptureWriter
+from GeoscanDecoder.ingest import Ingest, parse_endpoints
+from GeoscanDecoder.pipeline import Pipeline
+
+
+class Console:
+    def __init__(self, config, record=None, replay=None, speed=1.0, publish=None, postprocess=0, fsync='image',
+                 dedup=False):
+        if record and replay:
+            raise ValueError('a replay can\'t be recorded')
+        self.config = config
+        self.running = 0
+        self.replay = replay
+        self.speed = speed
+        self.endpoints = (parse_endpoints(config.get('main', 'servers'))
+                          or [(config.get('main', 'ip'), int(config.get('main', 'port')))])
+        self.recorders = []
+        if record:
+            record = pathlib.Path(record)
+            if len(self.endpoints) == 1:
+                self.recorders.append(CaptureWriter(record))
+            else:
+                # one capture per soundmodem, the streams can't be mixed
+                self.recorders.extend(CaptureWriter(record.with_name(f'{record.stem}_{i}{record.suffix}'))
+                                      for i in range(len(self.endpoints)))
+        self.pipeline = Pipeline(config.get('main', 'outdir'), config.getboolean('main', 'merge mode'),
+                                 db=config.get('main', 'db'), publish=publish, postprocess=postprocess,
+                                 fsync=fsync, dedup=dedup, log=self.log)
+        self._cur_fn = None
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.running = 1
+        try:
+            if self.replay:
+                self._replay()
+            else:
+                self._receive()
+        finally:
+            if self.pipeline.dedup is not None:
+                self.log(self.pipeline.dedup.stats())
+            self.pipeline.close()
+            if self.pipeline.writer:
+                self.log(self.pipeline.writer.stats())
+            if self.pipeline.postproc:
+                self.log(self.pipeline.postproc.stats())
+            for r in self.recorders:
+                r.close()
+
+    def stop(self, signum=None, frame=None):
+        self.running = 0
+
+    @staticmethod
+    def log(msg):
+        print(msg, file=sys.stderr, flush=True)
+
+    def _receive(self):
+        ingest = Ingest(self.endpoints, [r.write for r in self.recorders], log=self.log)
+        try:
+            while self.running:
+                n = 0
+                for src, data in ingest.poll(0.5):
+                    self._report(*self.pipeline.process(data))
+                    n += 1
+                self.pipeline.wait_output()
+                if not n:
+                    self.pipeline.tick()
+        finally:
+            for src in ingest.sources:
+                self.log(src.stats())
+            ingest.close()
+
+    def _replay(self):
+        src = CaptureSocket(self.replay, self.speed)
+        src.settimeout(0.5)
+        framer = AGWPEFramer()
+        print(f'Replaying {self.replay}', flush=True)
+
+        while self.running:
+            try:
+                n = framer.recv_into(src)
+            except (sk.timeout, TimeoutError):
+                self.pipeline.tick()
+                continue
+
+            if not n:
+                print('Replay finished', flush=True)
+                break
+
+            for tlm, fp, x in self.pipeline.process_frames(framer):
+                self._report(tlm, fp, x)
+            self.pipeline.wait_output()
+
+        src.close()
+
+    def _report(self, tlm, fp, x):
+        if tlm:
+            print(f'Telemetry: {tlm.time} -> {fp.name}', flush=True)
+
+        if x:
+            img = self.pipeline.ir.current_image
+            if img and img.path.name != self._cur_fn:
+                self._cur_fn = img.path.name
+                print(f'Image: {self._cur_fn}', flush=True)
+            if x == 2:
+                img = self.pipeline.ir.last_image
+                print(f'Image done: {img.path.name} ({img.report()})', flush=True)
+                self._cur_fn = None
@@ -0,0 +1,52 @@
+import collections
+import hashlib
+import time
+
+
+class DedupCache:
+    # remembers digests of recently seen AX.25 payloads, bounded both by count and by age
+    def __init__(self, max_entries=2048, ttl=120.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def seen(self, data, now=None):
+        # True if the same payload was already passed within ttl, otherwise remembers it
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+
+        k = self.key(data)
+        if k in self._seen:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self._seen[k] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return False
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        limit = now - self.ttl
+        # entries are in insertion order, so the oldest are first
+        while self._seen:
+            k, t = next(iter(self._seen.items()))
+            if t > limit:
+                break
+            del self._seen[k]
+
+    def clear(self):
+        self._seen.clear()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def stats(self):
+        return f'Duplicates: {self.hits} dropped, {self.misses} unique'
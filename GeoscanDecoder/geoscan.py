@@ -1,8 +1,15 @@
+import bisect
+import collections
 import datetime as dt
+import functools
 import pathlib
+import struct
+import time
 
 import construct
 
+from GeoscanDecoder import metrics
+
 
 ssid = construct.BitStruct(
     'ch' / construct.Flag,  # C / H bit
@@ -112,6 +119,58 @@ geoscan = construct.Struct(
 )
 
 
+# Fast path for `geoscan.parse(data).geoscan` on a precompiled struct layout.
+# `geoscan` above is the reference; scales and offsets must match `geoscan_frame`
+_geoscan_frame_st = struct.Struct('<I4H9B2HB')
+_EPOCH = dt.datetime(1970, 1, 1)
+_SHR1 = bytes(x >> 1 for x in range(256))
+
+
+def parse_tlm(data):
+    data = memoryview(data)
+    n = len(data)
+
+    # AX.25 addresses up to the extension bit, then control and pid
+    i = 0
+    while 1:
+        i += 7
+        if i > n:
+            return
+        if data[i - 1] & 1:
+            break
+    i += 2
+    if i > n or data[i - 1] != 0xF0 or data[:6].tobytes().translate(_SHR1) != b'BEACON':
+        return
+
+    if n - i < _geoscan_frame_st.size:
+        raise construct.StreamError(f'stream read less than specified amount, expected {_geoscan_frame_st.size}, '
+                                    f'found {n - i}')
+
+    (t, iab, isp, uab_per, uab_sum, tx_plus, tx_minus, ty_plus, ty_minus, tz_plus, tz_minus,
+     tab1, tab2, cpu_load, nres_osc, nres_commu, rssi) = _geoscan_frame_st.unpack_from(data, i)
+
+    return construct.Container(
+        time=_EPOCH + dt.timedelta(seconds=t),
+        Iab=float(iab) * 0.0766,
+        Isp=float(isp) * 0.03076,
+        Uab_per=float(uab_per) * 0.00006928,
+        Uab_sum=float(uab_sum) * 0.00013856,
+        Tx_plus=tx_plus,
+        Tx_minus=tx_minus,
+        Ty_plus=ty_plus,
+        Ty_minus=ty_minus,
+        Tz_plus=tz_plus,
+        Tz_minus=tz_minus,
+        Tab1=tab1,
+        Tab2=tab2,
+        CPU_load=cpu_load,
+        Nres_osc=nres_osc - 7476,
+        Nres_CommU=nres_commu - 1505,
+        RSSI=rssi - 99,
+        pad=data[i + _geoscan_frame_st.size:].tobytes(),
+    )
+
+
 _frame = construct.Struct(
     'marker' / construct.Int16ul,           # #0
     'dlen' / construct.Int8ul,              # #2
@@ -123,22 +182,301 @@ _frame = construct.Struct(
 )
 
 
+# Fast path for `_frame.parse(data)`, `_frame` is the reference
+_frame_st = struct.Struct('<HBHHB')
+
+
+def parse_frame(data):
+    if len(data) < _frame_st.size:
+        raise construct.StreamError(f'stream read less than specified amount, expected {_frame_st.size}, '
+                                    f'found {len(data)}')
+    marker, dlen, mtype, offset, subsystem_num = _frame_st.unpack_from(data)
+    n = dlen - 6
+    if n < 0 or len(data) - _frame_st.size < n:
+        raise construct.StreamError(f'stream read less than specified amount, expected {max(n, 0)}, '
+                                    f'found {max(len(data) - _frame_st.size, 0)}')
+    return construct.Container(
+        marker=marker,
+        dlen=dlen,
+        mtype=mtype,
+        offset=offset,
+        subsystem_num=subsystem_num,
+        data=bytes(data[_frame_st.size:_frame_st.size + n]),
+    )
+
+
+class CoverageMap:
+    # sorted disjoint [start, end) byte ranges
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def prefix(self):
+        # length of the contiguous range from 0
+        return self.ends[0] if self.starts and not self.starts[0] else 0
+
+    def covers(self, start, end):
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def add(self, start, end):
+        if start >= end:
+            return
+        i = bisect.bisect_right(self.starts, start)
+        if i and self.ends[i - 1] >= start:
+            i -= 1
+        j = bisect.bisect_right(self.starts, end, i)
+        if j > i:
+            self.size -= sum(self.ends[i:j]) - sum(self.starts[i:j])
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+        self.size += end - start
+
+    def shift(self, delta):
+        # moves the ranges by delta, what falls below 0 is dropped
+        starts, ends = [], []
+        for s, e in zip(self.starts, self.ends):
+            s, e = max(s + delta, 0), e + delta
+            if s < e:
+                starts.append(s)
+                ends.append(e)
+        self.starts, self.ends = starts, ends
+        self.size = sum(ends) - sum(starts)
+
+    def gaps(self, start=0, end=None):
+        if end is None:
+            end = self.ends[-1] if self.ends else start
+        out = []
+        for s, e in zip(self.starts, self.ends):
+            if s > start:
+                out.append((start, min(s, end)))
+            start = max(start, e)
+            if start >= end:
+                break
+        if start < end:
+            out.append((start, end))
+        return out
+
+
+class JpegScanner:
+    # Walks JPEG segments over the contiguous head of an image as it grows: markers and
+    # segment lengths, SOFn for the picture size, entropy coded data after SOS up to the
+    # next real marker. Every byte is looked at once, EOI means all the image is here.
+    SOI, MARKER, SKIP, ENTROPY, DONE, ERROR = range(6)
+    SOF = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+
+    def __init__(self):
+        self.state = self.SOI
+        self.pos = 0
+        self.size = None    # (width, height) from SOFn
+        self.end = None     # image length up to EOI
+        self._skip_to = 0
+        self._after = self.MARKER
+
+    @property
+    def done(self):
+        return self.state == self.DONE
+
+    @property
+    def error(self):
+        return self.state == self.ERROR
+
+    def scan(self, buf, end):
+        # buf[:end] is known data, scanning continues from where it stopped last time
+        pos = self.pos
+        state = self.state
+        while pos < end:
+            if state == self.ENTROPY:
+                i = buf.find(b'\xff', pos, end)
+                if i < 0 or i + 1 >= end:
+                    pos = end if i < 0 else i
+                    break
+                m = buf[i + 1]
+                if not m or 0xD0 <= m <= 0xD7:
+                    # stuffed byte or restart marker
+                    pos = i + 2
+                elif m == 0xFF:
+                    pos = i + 1
+                else:
+                    pos = i
+                    state = self.MARKER
+
+            elif state == self.MARKER:
+                if buf[pos] != 0xFF:
+                    state = self.ERROR
+                    break
+                if end - pos < 2:
+                    break
+                m = buf[pos + 1]
+                if m == 0xFF:
+                    pos += 1
+                elif m == 0xD9:
+                    pos += 2
+                    self.end = pos
+                    state = self.DONE
+                    break
+                elif 0xD0 <= m <= 0xD7 or m == 0x01:
+                    pos += 2
+                elif m == 0xD8 or not m:
+                    state = self.ERROR
+                    break
+                else:
+                    if end - pos < 4:
+                        break
+                    n = buf[pos + 2] << 8 | buf[pos + 3]
+                    if n < 2:
+                        state = self.ERROR
+                        break
+                    if m in self.SOF:
+                        if end - pos < 9:
+                            break
+                        self.size = buf[pos + 7] << 8 | buf[pos + 8], buf[pos + 5] << 8 | buf[pos + 6]
+                    self._skip_to = pos + 2 + n
+                    self._after = self.ENTROPY if m == 0xDA else self.MARKER
+                    state = self.SKIP
+
+            elif state == self.SKIP:
+                if end < self._skip_to:
+                    pos = end
+                    break
+                pos = self._skip_to
+                state = self._after
+
+            elif state == self.SOI:
+                if end - pos < 2:
+                    break
+                if buf[pos] != 0xFF or buf[pos + 1] != 0xD8:
+                    state = self.ERROR
+                    break
+                pos += 2
+                state = self.MARKER
+
+            else:
+                break
+
+        self.pos = pos
+        self.state = state
+        return state
+
+
+class GeoscanImage:
+    def __init__(self, path, key=None, base_offset=0):
+        self.path = path
+        self.key = key
+        self.data = bytearray()
+        self.coverage = CoverageMap()
+        self.jpeg = JpegScanner()
+        self.eoi_seen = 0
+        self.base_offset = base_offset
+        self.has_starter = self.has_soi = 0
+        self.prev_data_sz = -1
+        self.rx_time = dt.datetime.utcnow()
+        self.created = self.last_update = time.monotonic()
+
+    def write(self, offset, data):
+        self.last_update = time.monotonic()
+        end = offset + len(data)
+        if self.coverage.covers(offset, end):
+            return 0
+
+        if offset > len(self.data):
+            self.data.extend(bytes(offset - len(self.data)))
+        self.data[offset:end] = data
+        self.coverage.add(offset, end)
+        n = self.coverage.prefix()
+        if n > self.jpeg.pos:
+            self.jpeg.scan(self.data, n)
+        return 1
+
+    def rebase(self, base_offset):
+        # the data moves with the base, what is before the new one is dropped
+        delta = self.base_offset - base_offset
+        self.base_offset = base_offset
+        if not delta:
+            return 0
+
+        if delta > 0:
+            self.data[:0] = bytes(delta)
+        else:
+            del self.data[:-delta]
+        self.coverage.shift(delta)
+        self.jpeg = JpegScanner()
+        n = self.coverage.prefix()
+        if n:
+            self.jpeg.scan(self.data, n)
+        return 1
+
+    def missing(self):
+        return self.coverage.gaps(0, len(self.data))
+
+    def report(self):
+        gaps = self.missing()
+        s = f'{self.coverage.size}/{len(self.data)} bytes'
+        if gaps:
+            s += f', missing {sum(e - b for b, e in gaps)} bytes in {len(gaps)} ranges: '
+            s += ', '.join(f'{b}-{e}' for b, e in gaps)
+        return s
+
+    def save(self):
+        if self.data:
+            self.path.write_bytes(self.data)
+
+
 class GeoscanImageReceiver:
     MARKER_IMG = 0x0001
     CMD_IMG_START = 0x0901
     CMD_IMG_FRAME = 0x0905
     BASE_OFFSET = 0     # old 4     # old 16384     # old 32768
+    MAX_SESSIONS = 4
+    IDLE_TIMEOUT = 600  # s
+    EOI_TIMEOUT = 60    # s, for images with the end received and some data before it missing
+    REPEAT_WINDOW = 60  # s, the same starter heard again within it joins the image, e.g. from another soundmodem
+    FINISHED_HOLD = 10  # s, late chunks of a finished image don't open a session of their own
 
-    def __init__(self, outdir):
+    def __init__(self, outdir, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT):
         self.outdir = pathlib.Path(outdir).expanduser().absolute()
         self.outdir.mkdir(parents=True, exist_ok=True)
-        self.files = {}
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        # images in progress keyed by (subsystem, base offset), least recently used first;
+        # the key follows the base offset when it moves to the image start
+        self.sessions = collections.OrderedDict()
+        self.current = None
+        self.last_image = None
+        # called with every saved image, by expiry and close() as well
+        self.on_finish = None
+        # write-behind output (writer.Writer), the files are written by chunks as they come
+        self.writer = None
         self.merge_mode = 0
-        self.base_offset = self.BASE_OFFSET
-        self.has_starter = self.has_soi = 0
-        self.current_fid = None
-        self._prev_data_sz = -1
         self._miss_cnt = 0
+        self._expire_t = time.monotonic()
+        # (subsystem, base offset, end, time) of the last finished images
+        self._finished = collections.deque(maxlen=max_sessions)
+
+    @property
+    def current_image(self):
+        return self.sessions.get(self.current)
+
+    @property
+    def base_offset(self):
+        img = self.current_image
+        return img.base_offset if img else self.BASE_OFFSET
+
+    @property
+    def has_starter(self):
+        img = self.current_image
+        return img.has_starter if img else 0
+
+    @property
+    def has_soi(self):
+        img = self.current_image
+        return img.has_soi if img else 0
 
     def set_outdir(self, outdir):
         self.outdir = pathlib.Path(outdir).expanduser().absolute()
@@ -148,91 +486,193 @@ class GeoscanImageReceiver:
         self.merge_mode = val
 
     def generate_fid(self):
-        if not (self.current_fid and self.merge_mode):
-            self.current_fid = f'GEOSCAN_{dt.datetime.now()}'.replace(' ', '_').replace(':', '-')
-        return self.current_fid
+        return f'GEOSCAN_{dt.datetime.now()}'.replace(' ', '_').replace(':', '-')
+
+    def new_image(self, key, base_offset=BASE_OFFSET):
+        self.finish(key)
+        img = GeoscanImage(self.outdir / (self.generate_fid() + '.jpg'), key, base_offset)
+        self.sessions[key] = img
+        while len(self.sessions) > self.max_sessions:
+            self.finish(next(iter(self.sessions)))
+        return img
+
+    def _rebase(self, img, base_offset):
+        # an earlier chunk of the subsystem then gets a session of its own instead of
+        # finishing this one by its stale key
+        key = img.key[0], base_offset
+        if key != img.key:
+            self.finish(key)
+            del self.sessions[img.key]
+            if self.current == img.key:
+                self.current = key
+            img.key = key
+            self.sessions[key] = img
+        if img.rebase(base_offset) and self.writer and img.data:
+            # the file was written relative to the old base; the tail is cut by finish()
+            self.writer.write(img.path, 0, img.data)
 
     def force_new(self):
-        f = self.files.get(self.current_fid)
-        if f:
-            f.close()
-        self.has_starter = self.has_soi = self.current_fid = 0
-        self.new_file(self.generate_fid())
-
-    def new_file(self, fid):
-        fn = self.outdir / (fid + '.jpg')
-        f = open(fn, 'w+b')
-        self.files[fid] = f
-        return f
+        img = self.current_image
+        key = img.key if img else (None, self.BASE_OFFSET)
+        self.current = key
+        return self.new_image(key)
+
+    def finish(self, key):
+        img = self.sessions.pop(key, None)
+        if img:
+            self.last_image = img
+            self._finished.append((img.key[0], img.base_offset, img.base_offset + len(img.data), time.monotonic()))
+            if self.writer:
+                # on_finish only once the file is complete
+                then = self.on_finish and functools.partial(self.on_finish, img)
+                self.writer.finish(img.path, len(img.data), then)
+                return img
+
+            img.save()
+            if self.on_finish:
+                self.on_finish(img)
+        return img
+
+    def expire(self, now=None):
+        now = now or time.monotonic()
+        for key in [k for k, img in self.sessions.items() if now - img.last_update >= self._timeout(img)]:
+            self.finish(key)
+
+    def _timeout(self, img):
+        return min(self.EOI_TIMEOUT, self.idle_timeout) if img.eoi_seen else self.idle_timeout
+
+    def close(self):
+        for key in list(self.sessions):
+            self.finish(key)
+        self.current = None
+
+    @classmethod
+    def is_start(cls, data):
+        # CMD_IMG_START frames are legitimately repeated, e.g. when an image is sent again
+        if len(data) < _frame_st.size:
+            return False
+        marker, _, mtype, _, _ = _frame_st.unpack_from(data)
+        return marker == cls.MARKER_IMG and mtype == cls.CMD_IMG_START
 
     def push_data(self, data):
-        data = self.parse_data(data)
-        if not data:
-            return
-
-        # fid = self.file_id(data)
-        fid = self.current_fid or self.generate_fid()
-        if not fid:
-            fid = self.current_fid
+        now = time.monotonic()
+        if now - self._expire_t >= 1:
+            self._expire_t = now
+            self.expire(now)
 
-        f = self.files.get(fid)
-        if not f:
-            f = self.new_file(fid)
-
-        self.current_fid = fid
+        x = self.parse_data(data)
+        if not x:
+            return
 
-        f.seek(data.offset)
-        f.write(data.data)
-        f.flush()
+        img, data = x
+        self.current = img.key
+        self.sessions.move_to_end(img.key)
+        if img.write(data.offset, data.data) and self.writer:
+            self.writer.write(img.path, data.offset, data.data)
 
-        if self.is_last_data(data) and not self.merge_mode:
-            f.close()
-            self.current_fid = None
-            self.base_offset = self.BASE_OFFSET
-            self.has_starter = self.has_soi = 0
+        if self.is_last_data(img, data) and not self.merge_mode:
+            self.finish(img.key)
+            self.current = None
             return 2
 
         return 1
 
+    def _session(self, subsystem, offset):
+        # image with the nearest base offset not above the chunk
+        if self.merge_mode:
+            return self.current_image or next(reversed(self.sessions.values()), None)
+
+        best = None
+        for img in self.sessions.values():
+            if img.key[0] == subsystem and img.base_offset <= offset:
+                if not best or img.base_offset > best.base_offset:
+                    best = img
+        return best
+
+    def _repeated(self, key, data):
+        # the starter of the image in progress heard again: another soundmodem lagging behind
+        # adds its chunks to it; the satellite sending the image again is told apart by the time
+        img = self.sessions.get(key)
+        if (img and img.has_starter and time.monotonic() - img.created < self.REPEAT_WINDOW
+                and img.data[:len(data)] == data):
+            return img
+
+    def _headless(self, subsystem, offset):
+        # chunks heard before the starter, which this soundmodem lost and another one didn't:
+        # they are of the image if all of them are after the starter
+        img = self._session(subsystem, offset)
+        if (img and not img.has_starter and not img.has_soi and time.monotonic() - img.created < self.REPEAT_WINDOW
+                and img.coverage.starts and img.base_offset + img.coverage.starts[0] >= offset):
+            return img
+
+    def _finished_recently(self, subsystem, offset):
+        now = time.monotonic()
+        return any(s == subsystem and b <= offset < e and now - t < self.FINISHED_HOLD
+                   for s, b, e, t in self._finished)
+
     def parse_data(self, data):
         try:
-            data = _frame.parse(data)
+            data = parse_frame(data)
         except construct.ConstructError:
             return
 
         if data.marker != self.MARKER_IMG:
             self._miss_cnt += 1
+            metrics.NON_IMAGE.inc()
             return
 
+        key = data.subsystem_num, data.offset
         if data.mtype == self.CMD_IMG_START:
+            img = self.merge_mode and self._session(*key)
+            if not img:
+                img = self._repeated(key, data.data) or self._headless(*key)
+            if img:
+                self._rebase(img, data.offset)
+            else:
+                img = self.new_image(key, data.offset)
             if data.data.startswith(b'\xff\xd8'):
-                self.has_soi = data.offset
-            self.has_starter = 1
-            self.base_offset = data.offset
+                img.has_soi = data.offset
+            img.has_starter = 1
             data.offset = 0
-            self.generate_fid()
 
         elif data.mtype == self.CMD_IMG_FRAME:
-            if (not self.has_starter
-                    and not self.has_soi
-                    and data.data.startswith(b'\xff\xd8')):
-                self.base_offset = data.offset
-                self.has_soi = data.offset
-                self.generate_fid()
-
-            x = data.offset - self.base_offset
+            img = self._session(*key)
+            if not img and self._finished_recently(*key):
+                return
+            if data.data.startswith(b'\xff\xd8'):
+                if not img:
+                    img = self.new_image(key, data.offset)
+                if not img.has_starter and not img.has_soi:
+                    self._rebase(img, data.offset)
+                    img.has_soi = data.offset
+            elif not img:
+                img = self.new_image((data.subsystem_num, self.BASE_OFFSET))
+
+            x = data.offset - img.base_offset
             if x < 0:
-                self.force_new()
-                self.base_offset = self.BASE_OFFSET
-                x = data.offset - self.base_offset
+                # merge mode, the chunk is before the image: start over
+                self.finish(img.key)
+                img = self.new_image((data.subsystem_num, self.BASE_OFFSET))
+                x = data.offset - img.base_offset
             data.offset = x
 
         else:
             return
 
-        return data
-
-    def is_last_data(self, data):
-        prev_sz = self._prev_data_sz
-        self._prev_data_sz = len(data.data)
-        return (self._prev_data_sz < prev_sz) and b'\xff\xd9' in data.data
+        return img, data
+
+    @staticmethod
+    def is_last_data(img, data):
+        prev_sz = img.prev_data_sz
+        img.prev_data_sz = len(data.data)
+        if img.jpeg.done:
+            return True
+
+        # the last chunk is the short one with EOI, the only way to tell when the image
+        # head is missing or isn't a JPEG
+        last = (img.prev_data_sz < prev_sz) and b'\xff\xd9' in data.data
+        if last and img.jpeg.pos and not img.jpeg.error:
+            # data before the end is still missing, the scanner will tell when it comes
+            img.eoi_seen = 1
+            return False
+        return last
@@ -0,0 +1,117 @@
+import argparse
+import selectors
+import socket as sk
+import time
+
+from GeoscanDecoder import AGWPE_CON
+from GeoscanDecoder.agwpe import AGWPEFramer
+
+
+def parse_endpoints(s, default_port=8000):
+    # 'host:port, host, host:, ...' -> [(host, port), ...]
+    out = []
+    for x in s.replace(';', ',').split(','):
+        x = x.strip()
+        if not x:
+            continue
+        host, _, port = x.rpartition(':') if ':' in x else (x, '', '')
+        try:
+            port = int(port or default_port)
+        except ValueError:
+            port = -1
+        if not host or not 0 < port < 0x10000:
+            raise argparse.ArgumentTypeError(f'bad soundmodem endpoint {x!r}, expected host[:port]')
+        out.append((host, port))
+    return out
+
+
+class Source:
+    def __init__(self, host, port, tap=None):
+        self.host = host
+        self.port = int(port)
+        self.name = f'{host}:{port}'
+        self.sk = None
+        self.framer = AGWPEFramer(tap=tap)
+        self.retry_t = 0
+        self.connects = 0
+        self.bytes = 0
+        self.frames = 0
+        self.last_rx = None
+
+    def stats(self):
+        return f'{self.name}: {self.frames} frames, {self.bytes} bytes, {self.connects} connects'
+
+
+class Ingest:
+    # reads several soundmodems in one thread and merges their frames in arrival order
+    RECONNECT_DELAY = 5
+
+    def __init__(self, endpoints, taps=None, log=None):
+        taps = taps or [None] * len(endpoints)
+        self.sources = [Source(host, port, tap) for (host, port), tap in zip(endpoints, taps)]
+        self.sel = selectors.DefaultSelector()
+        self.log = log or (lambda msg: None)
+
+    def connect(self):
+        now = time.monotonic()
+        for src in self.sources:
+            if src.sk or now < src.retry_t:
+                continue
+
+            try:
+                s = sk.create_connection((src.host, src.port), timeout=1)
+                s.sendall(AGWPE_CON)
+                s.setblocking(False)
+            except OSError as e:
+                src.retry_t = now + self.RECONNECT_DELAY
+                self.log(f'Connection to {src.name} failed: {e.strerror or e}')
+                continue
+
+            src.sk = s
+            src.connects += 1
+            src.framer.reset()
+            self.sel.register(s, selectors.EVENT_READ, src)
+            self.log(f'Connected to {src.name}')
+
+    def _drop(self, src, msg):
+        self.sel.unregister(src.sk)
+        src.sk.close()
+        src.sk = None
+        src.retry_t = time.monotonic() + self.RECONNECT_DELAY
+        self.log(f'{src.name}: {msg}')
+
+    def poll(self, timeout=0.5):
+        # yields (source, AX.25 payload) of monitored frames; payload is valid until the next step
+        self.connect()
+        if not self.sel.get_map():
+            time.sleep(timeout)
+            return
+
+        for key, _ in self.sel.select(timeout):
+            src = key.data
+            try:
+                n = src.framer.recv_into(src.sk)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError as e:
+                self._drop(src, f'Connection error: {e.strerror or e}')
+                continue
+
+            if not n:
+                self._drop(src, 'Connection lost')
+                continue
+
+            src.bytes += n
+            src.last_rx = time.time()
+            for frame in src.framer.frames():
+                if frame.kind == b'K':
+                    src.frames += 1
+                    yield src, frame.ax25
+
+    def close(self):
+        for src in self.sources:
+            if src.sk:
+                self.sel.unregister(src.sk)
+                src.sk.close()
+                src.sk = None
+        self.sel.close()
@@ -0,0 +1,207 @@
+import argparse
+import bisect
+import json
+import pathlib
+
+from GeoscanDecoder.agwpe import AGWPEFramer
+from GeoscanDecoder.capture import is_capture, read_stream
+from GeoscanDecoder.geoscan import CoverageMap, GeoscanImageReceiver, JpegScanner
+
+
+# Offline merge of partial receptions of the same images from many captures (passes or
+# stations). Captures are read one at a time; an image of a capture is put into a merged
+# image with the same subsystem and base offset whose received bytes it doesn't contradict.
+# Partial images with their head lost (no starter / SOI) are placed by their absolute offsets
+# and need MIN_OVERLAP matching bytes with the merged image.
+
+MIN_OVERLAP = 56
+
+
+def _intersections(cov, start, end):
+    # parts of [start, end) covered by `cov`
+    i = max(bisect.bisect_right(cov.starts, start) - 1, 0)
+    while i < len(cov.starts) and cov.starts[i] < end:
+        s, e = max(cov.starts[i], start), min(cov.ends[i], end)
+        if s < e:
+            yield s, e
+        i += 1
+
+
+class _PartialReceiver(GeoscanImageReceiver):
+    # hands finished images over instead of saving them
+    def __init__(self, outdir, source, sink):
+        super().__init__(outdir, idle_timeout=float('inf'))
+        self.EOI_TIMEOUT = float('inf')
+        # one source decoded faster than real time, a starter heard again is the image sent again
+        self.REPEAT_WINDOW = 0
+        self.source = source
+        self.sink = sink
+
+    def finish(self, key):
+        img = self.sessions.pop(key, None)
+        if img and img.coverage.size:
+            self.sink(self.source, img)
+        return img
+
+
+class MergedImage:
+    def __init__(self, subsystem, base_offset):
+        self.subsystem = subsystem
+        self.base_offset = base_offset
+        self.data = bytearray()
+        self.coverage = CoverageMap()
+        self.sources = []   # (source, CoverageMap of its bytes)
+        self.conflicts = 0
+        self.name = None
+
+    def match(self, img, shift):
+        # (overlapping bytes, all of them equal) with `img` moved by -shift
+        overlap = 0
+        for s, e in zip(img.coverage.starts, img.coverage.ends):
+            s, e = max(s - shift, 0), e - shift
+            for a, b in _intersections(self.coverage, s, e):
+                if self.data[a:b] != img.data[a + shift:b + shift]:
+                    return overlap, False
+                overlap += b - a
+        return overlap, True
+
+    def add(self, source, img, shift):
+        cov = CoverageMap()
+        for s, e in zip(img.coverage.starts, img.coverage.ends):
+            s0 = max(s - shift, 0)
+            e0 = e - shift
+            if s0 >= e0:
+                continue
+            if e0 > len(self.data):
+                self.data.extend(bytes(e0 - len(self.data)))
+            self.data[s0:e0] = img.data[s0 + shift:e0 + shift]
+            self.coverage.add(s0, e0)
+            cov.add(s0, e0)
+        self.sources.append((source, cov))
+
+    def jpeg(self):
+        sc = JpegScanner()
+        sc.scan(self.data, self.coverage.prefix())
+        return sc
+
+    def report(self):
+        sc = self.jpeg()
+        gaps = self.coverage.gaps(0, len(self.data))
+        return {
+            'name': self.name,
+            'subsystem': self.subsystem,
+            'base_offset': self.base_offset,
+            'size': sc.end or len(self.data),
+            'received': self.coverage.size,
+            'complete': sc.done,
+            'picture': sc.size,
+            'missing': gaps,
+            'sources': [{'source': src, 'bytes': cov.size, 'ranges': list(zip(cov.starts, cov.ends))}
+                        for src, cov in self.sources],
+        }
+
+
+class ImageMerger:
+    def __init__(self, min_overlap=MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self.images = []
+        self._by_subsystem = {}
+        self.unplaced = []
+
+    def add(self, source, img):
+        subsystem = img.key[0] if img.key else None
+        aligned = img.has_starter or img.has_soi
+        groups = self._by_subsystem.setdefault(subsystem, [])
+
+        best = None
+        for g in groups:
+            if aligned:
+                if g.base_offset != img.base_offset:
+                    continue
+                shift = 0
+            elif g.base_offset < img.base_offset + len(img.data):
+                # head lost, data is at absolute offsets
+                shift = g.base_offset - img.base_offset
+            else:
+                continue
+
+            overlap, ok = g.match(img, shift)
+            if not ok:
+                g.conflicts += 1
+                continue
+            if not aligned and overlap < self.min_overlap:
+                continue
+            if not best or overlap > best[0]:
+                best = overlap, g, shift
+
+        if best:
+            best[1].add(source, img, best[2])
+        elif aligned:
+            g = MergedImage(subsystem, img.base_offset)
+            g.add(source, img, 0)
+            groups.append(g)
+            self.images.append(g)
+        else:
+            self.unplaced.append((source, img.coverage.size))
+
+    def add_capture(self, fp, outdir):
+        # images of one capture file or raw AGWPE dump
+        ir = _PartialReceiver(outdir, str(fp), self.add)
+        framer = AGWPEFramer()
+        for _, chunk in read_stream(fp):
+            framer.feed(chunk)
+            for frame in framer.frames():
+                if frame.kind == b'K':
+                    ir.push_data(bytes(frame.ax25))
+        ir.close()
+
+    def save(self, outdir):
+        outdir = pathlib.Path(outdir).expanduser().absolute()
+        outdir.mkdir(parents=True, exist_ok=True)
+        seen = {}
+        reports = []
+        for g in self.images:
+            n = seen[g.subsystem, g.base_offset] = seen.get((g.subsystem, g.base_offset), 0) + 1
+            g.name = f'GEOSCAN_merged_{g.subsystem}_{g.base_offset}_{n}.jpg'
+            sc = g.jpeg()
+            (outdir / g.name).write_bytes(g.data[:sc.end] if sc.done else g.data)
+            reports.append(g.report())
+
+        report = {'images': reports,
+                  'unplaced': [{'source': src, 'bytes': n} for src, n in self.unplaced]}
+        with (outdir / 'merge_report.json').open('w') as f:
+            json.dump(report, f, indent=1)
+        return report
+
+
+def merge(paths, outdir, min_overlap=MIN_OVERLAP):
+    m = ImageMerger(min_overlap)
+    for p in map(pathlib.Path, paths):
+        p = p.expanduser()
+        files = sorted(fp for fp in p.iterdir() if fp.is_file() and is_capture(fp)) if p.is_dir() else [p]
+        for fp in files:
+            m.add_capture(fp, outdir)
+    return m.save(outdir)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Merge partial receptions of images from several captures')
+    ap.add_argument('capture', nargs='+', help='Capture or raw AGWPE dump files, or directories with captures')
+    ap.add_argument('--outdir', required=True, help='Directory to store merged images and merge_report.json')
+    ap.add_argument('--min-overlap', type=int, default=MIN_OVERLAP,
+                    help='Matching bytes needed to place an image with its head lost')
+    args = ap.parse_args()
+
+    report = merge(args.capture, args.outdir, args.min_overlap)
+    for r in report['images']:
+        missing = sum(e - s for s, e in r['missing'])
+        s = f'{r["name"]}: {r["received"]}/{r["size"]} bytes from {len(r["sources"])} sources'
+        if r['complete']:
+            s += ', complete'
+        elif r['missing']:
+            s += f', missing {missing} bytes in {len(r["missing"])} ranges'
+        else:
+            s += ', the end is missing'
+        print(s)
+    if report['unplaced']:
+        print(f'{len(report["unplaced"])} partial images could not be placed')
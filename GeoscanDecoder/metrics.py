@@ -0,0 +1,241 @@
+import bisect
+import threading
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+def _fmt_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    # updated only from the decoding thread without a lock, readers may see a slightly stale value
+    kind = 'counter'
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name):
+        yield name, self.labels, self.value
+
+    def get(self):
+        return self.value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.value = 0
+        self._fn = None
+
+    def set(self, v):
+        self.value = v
+
+    def set_function(self, fn):
+        # value taken from `fn()` at collection time, None to stop
+        self._fn = fn
+
+    def get(self):
+        if self._fn:
+            try:
+                return self._fn()
+            except Exception:
+                return float('nan')
+        return self.value
+
+    def samples(self, name):
+        yield name, self.labels, self.get()
+
+
+class Histogram:
+    kind = 'histogram'
+    # seconds, from 1 us to 1 s
+    BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.1, 1.0)
+
+    def __init__(self, labels=None, buckets=BUCKETS):
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def get(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': dict(zip(self.buckets + (float('inf'),), self._cumulative()))}
+
+    def quantile(self, q):
+        # linear interpolation inside the bucket, like Prometheus histogram_quantile()
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        lo, acc = 0.0, 0
+        for hi, c in zip(self.buckets + (float('inf'),), self.counts):
+            if c and acc + c >= rank:
+                if hi == float('inf'):
+                    return lo
+                return lo + (hi - lo) * (rank - acc) / c
+            acc += c
+            lo = hi
+        return lo
+
+    def _cumulative(self):
+        out, acc = [], 0
+        for c in self.counts:
+            acc += c
+            out.append(acc)
+        return out
+
+    def samples(self, name):
+        for le, c in zip(self.buckets + (float('inf'),), self._cumulative()):
+            yield name + '_bucket', dict(self.labels, le=_fmt_value(le)), c
+        yield name + '_sum', self.labels, self.sum
+        yield name + '_count', self.labels, self.count
+
+
+class Family:
+    # metric with the same name and help for every combination of label values
+    def __init__(self, cls, name, doc, **kwargs):
+        self.cls = cls
+        self.name = name
+        self.doc = doc
+        self.kwargs = kwargs
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        m = self.children.get(key)
+        if m is None:
+            with self._lock:
+                m = self.children.setdefault(key, self.cls(labels, **self.kwargs))
+        return m
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.cls.kind}']
+        for m in list(self.children.values()):
+            for name, labels, v in m.samples(self.name):
+                lines.append(f'{name}{_fmt_labels(labels)} {_fmt_value(v)}')
+        return lines
+
+    def get(self):
+        if list(self.children) == [()]:
+            return self.children[()].get()
+        return {','.join(f'{k}={v}' for k, v in key): m.get() for key, m in list(self.children.items())}
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def _add(self, cls, name, doc, **kwargs):
+        f = self.families.get(name)
+        if f is None:
+            f = self.families[name] = Family(cls, name, doc, **kwargs)
+        return f
+
+    def counter(self, name, doc):
+        return self._add(Counter, name, doc).labels()
+
+    def gauge(self, name, doc):
+        return self._add(Gauge, name, doc).labels()
+
+    def histogram(self, name, doc, buckets=Histogram.BUCKETS):
+        # a family, pick the series with .labels(...)
+        return self._add(Histogram, name, doc, buckets=buckets)
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for f in list(self.families.values()):
+            lines.extend(f.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {name: f.get() for name, f in list(self.families.items())}
+
+
+REGISTRY = Registry()
+
+BYTES_READ = REGISTRY.counter('geoscan_bytes_read_total', 'Bytes read from soundmodem')
+FRAMES = REGISTRY.counter('geoscan_frames_total', 'Monitored AX.25 frames received')
+DUPLICATES = REGISTRY.counter('geoscan_duplicate_frames_total', 'Repeated frames dropped before parsing')
+PARSE_ERRORS = REGISTRY.counter('geoscan_parse_errors_total', 'Frames failed to parse')
+NON_IMAGE = REGISTRY.counter('geoscan_non_image_frames_total', 'Frames with a non-image marker')
+TELEMETRY = REGISTRY.counter('geoscan_telemetry_frames_total', 'Telemetry frames decoded')
+IMAGE_CHUNKS = REGISTRY.counter('geoscan_image_chunks_total', 'Image chunks written')
+IMAGES = REGISTRY.counter('geoscan_images_completed_total', 'Images completed')
+EVENTS_DROPPED = REGISTRY.counter('geoscan_events_dropped_total', 'UI events dropped on a full queue')
+QUEUE_DEPTH = REGISTRY.gauge('geoscan_event_queue_depth', 'UI events waiting in the queue')
+LAST_FRAME = REGISTRY.gauge('geoscan_last_frame_timestamp_seconds', 'Unix time of the last received frame')
+WRITE_BACKLOG = REGISTRY.gauge('geoscan_write_backlog_bytes', 'Image data waiting for the writer')
+WRITE_STALL = REGISTRY.counter('geoscan_write_stall_seconds_total', 'Time the decoder waited for the writer')
+STAGE_TIME = REGISTRY.histogram('geoscan_stage_seconds', 'Frame processing time by stage')
+
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+
+def _handler():
+    # http.server pulls in a lot, so it is imported only when the endpoint is enabled
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = self.server.registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return http.server.ThreadingHTTPServer, Handler
+
+
+class MetricsServer(threading.Thread):
+    def __init__(self, host='127.0.0.1', port=9101, registry=REGISTRY):
+        super().__init__(daemon=True)
+        server_cls, handler = _handler()
+        self.httpd = server_cls((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.address = self.httpd.server_address
+
+    def run(self):
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def serve(addr):
+    # '[host:]port' -> started MetricsServer
+    host, _, port = addr.rpartition(':')
+    srv = MetricsServer(host or '127.0.0.1', int(port))
+    srv.start()
+    return srv
@@ -0,0 +1,145 @@
+import datetime as dt
+import pathlib
+import time
+
+import construct
+
+from GeoscanDecoder import metrics
+from GeoscanDecoder.dedup import DedupCache
+from GeoscanDecoder.geoscan import parse_tlm, GeoscanImageReceiver
+from GeoscanDecoder.publish import img_event, parse_address, tlm_event, Publisher
+from GeoscanDecoder.tlmlog import TelemetryLog
+from GeoscanDecoder.writer import Writer
+
+
+class Pipeline:
+    def __init__(self, outdir, merge_mode=0, dedup=False, db=None, publish=None, postprocess=0, write_behind=True,
+                 fsync='image', log=None):
+        self.outdir = pathlib.Path(outdir).expanduser().absolute()
+        self.ir = GeoscanImageReceiver(self.outdir)
+        self.ir.set_merge_mode(merge_mode)
+        self.tlm_log = TelemetryLog(self.outdir)
+        self.tlm_db = None
+        if db:
+            from GeoscanDecoder.tlmstore import TelemetryStore
+
+            self.tlm_db = TelemetryStore(db)
+        self.writer = None
+        if write_behind:
+            # file writes leave the receive path, the writer thread owns the log and the db
+            self.writer = Writer(fsync, log=log)
+            self.writer.sync_hooks.append(self.tlm_log.sync)
+            self.writer.start()
+            self.ir.writer = self.writer
+        self.publisher = None
+        if publish:
+            host, port, udp = parse_address(publish)
+            self.publisher = Publisher(host, port, udp, log=log)
+            self.publisher.start()
+        self.postproc = None
+        if postprocess:
+            from GeoscanDecoder.postproc import PostProcessor
+
+            self.postproc = PostProcessor(postprocess, log=log)
+            self.postproc.start()
+            self.ir.on_finish = self.postproc.submit
+        self.dedup = DedupCache() if dedup else None
+        self.parse_errors = 0
+        self._t_parse = metrics.STAGE_TIME.labels(stage='parse')
+        self._t_log = metrics.STAGE_TIME.labels(stage='log')
+        self._t_image = metrics.STAGE_TIME.labels(stage='image')
+        self._t_total = metrics.STAGE_TIME.labels(stage='total')
+
+    def set_outdir(self, outdir):
+        self.outdir = pathlib.Path(outdir).expanduser().absolute()
+        self.ir.set_outdir(self.outdir)
+        self._output(self.tlm_log.set_outdir, self.outdir)
+
+    def set_merge_mode(self, val):
+        self.ir.set_merge_mode(val)
+
+    def process(self, data):
+        # returns (telemetry, telemetry log path, image receiver result)
+        metrics.FRAMES.inc()
+        metrics.LAST_FRAME.set(time.time())
+        t0 = time.perf_counter()
+        tlm = fp = None
+        # the same frame heard by several demodulators; image starters always pass
+        if self.dedup is not None and not self.ir.is_start(data) and self.dedup.seen(data):
+            metrics.DUPLICATES.inc()
+            return tlm, fp, 0
+
+        try:
+            tlm = parse_tlm(data)
+        except construct.ConstructError:
+            self.parse_errors += 1
+            metrics.PARSE_ERRORS.inc()
+        t1 = time.perf_counter()
+        self._t_parse.observe(t1 - t0)
+
+        if tlm:
+            metrics.TELEMETRY.inc()
+            if self.writer:
+                # the frame buffer is reused before the writer gets to it
+                data = bytes(data)
+            rx_time = dt.datetime.utcnow()
+            fp = TelemetryLog.log_path(self.outdir, rx_time.date())
+            self._output(self.tlm_log.write, data, tlm, rx_time)
+            if self.tlm_db is not None:
+                self._output(self.tlm_db.write, data, tlm, rx_time)
+            if self.publisher and self.publisher.active:
+                self.publisher.publish(tlm_event(data, tlm))
+            t2 = time.perf_counter()
+            self._t_log.observe(t2 - t1)
+            t1 = t2
+
+        x = self.ir.push_data(data)
+        t2 = time.perf_counter()
+        self._t_image.observe(t2 - t1)
+        self._t_total.observe(t2 - t0)
+        if x:
+            metrics.IMAGE_CHUNKS.inc()
+            if x == 2:
+                metrics.IMAGES.inc()
+            if self.publisher and self.publisher.active:
+                self.publisher.publish(img_event(self.ir.last_image if x == 2 else self.ir.current_image, x))
+
+        return tlm, fp, x
+
+    def process_frames(self, framer):
+        for frame in framer.frames():
+            if frame.kind == b'K':
+                yield self.process(frame.ax25)
+
+    def tick(self):
+        # periodic housekeeping while no data comes
+        self.ir.expire()
+        if self.dedup is not None:
+            self.dedup.expire()
+        self._output(self.tlm_log.flush)
+        if self.tlm_db is not None:
+            self._output(self.tlm_db.flush)
+
+    def wait_output(self):
+        # blocks while the writer is behind, call it with no locks held
+        if self.writer:
+            self.writer.wait()
+
+    def _output(self, fn, *args):
+        # in order with the queued writes if there is the writer
+        if self.writer:
+            self.writer.call(fn, *args)
+        else:
+            fn(*args)
+
+    def close(self):
+        self.ir.close()
+        if self.writer:
+            self.writer.close()
+        self.tlm_log.close()
+        if self.tlm_db is not None:
+            self.tlm_db.close()
+        if self.publisher:
+            self.publisher.close()
+        if self.postproc:
+            self.postproc.close()
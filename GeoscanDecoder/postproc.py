@@ -0,0 +1,197 @@
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import datetime as dt
+import functools
+import json
+import pathlib
+import threading
+
+import PIL
+import PIL.Image
+import PIL.ImageFile
+
+
+PIL.ImageFile.LOAD_TRUNCATED_IMAGES = 1
+
+# Post-processing of saved images out of the decoding path: a thumbnail, a lossless PNG
+# (also the preview) and a <name>.json sidecar with the reception metadata. Jobs wait in a
+# bounded queue and run in a few worker processes; the sidecar records the size and mtime
+# of the source, so an image already processed in this or an earlier run is skipped.
+
+THUMB_SIZE = (160, 160)
+JOBS = 2
+MAX_PENDING = 32
+RETRIES = 2
+
+
+def image_meta(img):
+    return {
+        'name': img.path.name,
+        'rx_start': img.rx_time.isoformat(),
+        'rx_end': dt.datetime.utcnow().isoformat(),
+        'subsystem': img.key[0] if img.key else None,
+        'base_offset': img.base_offset,
+        'starter': bool(img.has_starter),
+        'soi': bool(img.has_soi),
+        'size': len(img.data),
+        'received': img.coverage.size,
+        'missing': img.missing(),
+        'complete': img.jpeg.done,
+    }
+
+
+def _sidecar(path):
+    return path.with_suffix('.json')
+
+
+def _stamp(path):
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def is_processed(path):
+    path = pathlib.Path(path)
+    try:
+        with _sidecar(path).open() as f:
+            return json.load(f).get('source') == _stamp(path)
+    except (OSError, ValueError):
+        return False
+
+
+def write_sidecar(path, meta):
+    path = pathlib.Path(path)
+    meta = dict(meta, source=_stamp(path))
+    tmp = _sidecar(path).with_suffix('.json.tmp')
+    with tmp.open('w') as f:
+        json.dump(meta, f, indent=1)
+    # the sidecar marks the job as done, so it must never be seen half written
+    tmp.replace(_sidecar(path))
+
+
+def process_image(path, meta):
+    # runs in a worker process, returns False if the image was processed already
+    path = pathlib.Path(path)
+    if is_processed(path):
+        return False
+
+    outputs = {}
+    try:
+        i = PIL.Image.open(path)
+        i.load()
+    except (OSError, SyntaxError, ValueError) as e:
+        # not a picture (the head is missing), the metadata is still of use
+        meta = dict(meta, error=str(e))
+    else:
+        if i.mode not in ('RGB', 'L'):
+            i = i.convert('RGB')
+        png = path.with_suffix('.png')
+        i.save(png, 'PNG', optimize=True)
+        outputs['png'] = png.name
+
+        i.thumbnail(THUMB_SIZE)
+        thumb = path.with_name(f'{path.stem}_thumb.jpg')
+        i.save(thumb, 'JPEG', quality=85)
+        outputs['thumbnail'] = thumb.name
+
+    write_sidecar(path, dict(meta, outputs=outputs))
+    return True
+
+
+class PostProcessor(threading.Thread):
+    # submit() only queues the job, this thread starts the worker processes and hands the
+    # jobs over, so the decoder never waits for either
+    def __init__(self, jobs=JOBS, max_pending=MAX_PENDING, retries=RETRIES, log=None):
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.max_pending = max_pending
+        self.retries = retries
+        self.log = log or (lambda msg: None)
+        self.processed = self.skipped = self.failed = self.dropped = 0
+        self.running = 1
+        self._executor = None
+        self._queue = collections.deque()
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def submit(self, img):
+        # called by the image receiver on every saved image
+        if not img.data or not img.path.exists():
+            return
+        job = str(img.path), image_meta(img), 0
+        with self._cond:
+            if len(self._queue) >= self.max_pending:
+                self.dropped += 1
+                self.log(f'Post-processing queue is full, {img.path.name} skipped')
+                return
+            self._queue.append(job)
+            self._cond.notify_all()
+
+    def _ready(self):
+        return (self._queue and self._running < self.jobs) or not (self.running or self._queue or self._running)
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._ready)
+                if not self._queue:
+                    break
+                job = self._queue.popleft()
+                self._running += 1
+
+            path, meta, tries = job
+            try:
+                if not self._executor:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(self.jobs)
+                fut = self._executor.submit(process_image, path, meta)
+            except (RuntimeError, BrokenProcessPool) as e:
+                # a worker died and the pool is unusable, the next try starts another one
+                self._executor = None
+                with self._cond:
+                    self._running -= 1
+                    self._retry(job, e)
+                continue
+            fut.add_done_callback(functools.partial(self._done, job))
+
+        if self._executor:
+            self._executor.shutdown()
+
+    def _done(self, job, fut):
+        with self._cond:
+            self._running -= 1
+            try:
+                if fut.result():
+                    self.processed += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._executor = None
+                self._retry(job, e)
+            self._cond.notify_all()
+
+    def _retry(self, job, e):
+        path, meta, tries = job
+        if tries < self.retries:
+            self.log(f'Post-processing {pathlib.Path(path).name} failed: {e}, retrying')
+            self._queue.append((path, meta, tries + 1))
+            return
+
+        self.failed += 1
+        self.log(f'Post-processing {pathlib.Path(path).name} failed: {e}')
+        try:
+            write_sidecar(path, dict(meta, error=str(e), outputs={}))
+        except OSError:
+            pass
+
+    def stats(self):
+        return (f'Post-processing: {self.processed} processed, {self.skipped} skipped, '
+                f'{self.failed} failed, {self.dropped} dropped')
+
+    def close(self):
+        # finishes the queued jobs
+        with self._cond:
+            self.running = 0
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
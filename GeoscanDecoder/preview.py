@@ -0,0 +1,62 @@
+import io
+import time
+
+import PIL
+import PIL.Image
+import PIL.ImageFile
+
+
+PIL.ImageFile.LOAD_TRUNCATED_IMAGES = 1
+
+
+class JpegPreview:
+    # decodes the contiguous head of an in-progress image, no more often than
+    # `max_rate` times per second and, unless idle for a while, only after the head
+    # grew by `min_step` bytes or GROWTH of its size, so the total decode work stays linear
+    IDLE = 1.0
+    GROWTH = 0.1
+
+    def __init__(self, size=(640, 640), min_step=512, max_rate=4.0):
+        self.size = size
+        self.min_step = min_step
+        self.max_rate = max_rate
+        self.reset()
+
+    def reset(self):
+        self._img = None
+        self._done = 0
+        self._t = 0
+
+    def snapshot(self, img, force=False):
+        # call with the image receiver lock held; returns data worth decoding or None
+        if img is not self._img:
+            self.reset()
+            self._img = img
+
+        n = img.coverage.prefix()
+        if n <= self._done:
+            return
+        now = time.monotonic()
+        if not force:
+            if now - self._t < 1 / self.max_rate:
+                return
+            step = max(self.min_step, int(self._done * self.GROWTH))
+            if n - self._done < step and now - self._t < self.IDLE:
+                return
+
+        self._done = n
+        self._t = now
+        return bytes(img.data[:n])
+
+    def decode(self, data):
+        try:
+            i = PIL.Image.open(io.BytesIO(data))
+            # let the JPEG decoder scale down by 1/2..1/8 instead of decoding at full size
+            i.draft('RGB', self.size)
+            i.load()
+        except (OSError, SyntaxError, ValueError):
+            return
+
+        if i.width > self.size[0] or i.height > self.size[1]:
+            i.thumbnail(self.size)
+        return i
@@ -0,0 +1,156 @@
+import functools
+import sys
+import time
+
+from GeoscanDecoder import metrics
+
+
+# --profile: where the time of a pass goes. Stage times are collected into the STAGE_TIME
+# histograms (the pipeline fills parse/log/image/total, the writer fills write, hooks add
+# the rest), cProfile and tracemalloc are optional as they slow the decoding down.
+# The module isn't named `profile`: cProfile imports the standard one.
+
+TOP = 15
+
+
+class Profiler:
+    def __init__(self, cpu=None, mem=0, out=sys.stderr):
+        self.cpu = cpu      # cProfile stats file, None - off
+        self.mem = mem      # tracemalloc traceback depth, 0 - off
+        self.out = out
+        self._hooks = []
+        self._prof = None
+        self._profiles = []     # of other threads
+        self._snap = None
+        self._t = self._cpu_t = 0
+        self._frames = 0
+
+    def hook(self, obj, name, stage):
+        # time every call of obj.name() as `stage`
+        fn = getattr(obj, name)
+        h = metrics.STAGE_TIME.labels(stage=stage)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                h.observe(time.perf_counter() - t)
+
+        setattr(obj, name, timed)
+        self._hooks.append((obj, name, fn))
+
+    def hook_thread(self, cls):
+        # cProfile sees only the thread it is enabled in, so threads of `cls` get their own
+        if self.cpu is None:
+            return
+        import cProfile
+
+        run = cls.run
+        profiles = self._profiles
+
+        @functools.wraps(run)
+        def profiled(thread):
+            p = cProfile.Profile()
+            try:
+                p.enable()
+            except ValueError:
+                # Python 3.12+ allows one profiler at a time, the main one sees all threads then
+                return run(thread)
+            profiles.append(p)
+            try:
+                return run(thread)
+            finally:
+                p.disable()
+
+        cls.run = profiled
+        self._hooks.append((cls, 'run', run))
+
+    def instrument(self, pipeline):
+        ir = pipeline.ir
+        self.hook(ir, 'parse_data', 'frame_parse')
+        self.hook(ir, 'finish', 'image_finish')
+        if pipeline.publisher:
+            self.hook(pipeline.publisher, 'publish', 'publish')
+
+    def instrument_ui(self, app):
+        from GeoscanDecoder.worker import ReceiverThread
+
+        self.hook(app, '_poll', 'ui_poll')
+        self.hook(app, '_fill_canvas', 'ui_canvas')
+        self.hook(app.render, 'flush', 'ui_render')
+        self.hook_thread(ReceiverThread)
+
+    def start(self):
+        self._frames = metrics.FRAMES.get()
+        if self.mem:
+            import tracemalloc
+
+            tracemalloc.start(self.mem)
+            self._snap = tracemalloc.take_snapshot()
+        if self.cpu is not None:
+            import cProfile
+
+            self._prof = cProfile.Profile()
+            self._prof.enable()
+        self._t = time.perf_counter()
+        self._cpu_t = time.process_time()
+
+    def stop(self):
+        self._t = time.perf_counter() - self._t
+        self._cpu_t = time.process_time() - self._cpu_t
+        if self._prof:
+            self._prof.disable()
+        for obj, name, fn in reversed(self._hooks):
+            if isinstance(obj, type):
+                setattr(obj, name, fn)
+            else:
+                delattr(obj, name)
+        self._hooks = []
+
+    def report(self):
+        p = functools.partial(print, file=self.out)
+        frames = metrics.FRAMES.get() - self._frames
+        p(f'Profile: {self._t:.2f} s, CPU {self._cpu_t:.2f} s, {frames} frames'
+          + (f', {frames / self._t:.0f} frames/s' if self._t else ''))
+
+        p(f'{"stage":<14}{"calls":>10}{"total, s":>11}{"share":>8}{"mean, us":>11}{"p50, us":>10}{"p99, us":>10}')
+        for key, h in sorted(metrics.STAGE_TIME.children.items()):
+            if not h.count:
+                continue
+            stage = dict(key).get('stage', '')
+            p(f'{stage:<14}{h.count:>10}{h.sum:>11.3f}{h.sum / self._t if self._t else 0:>8.1%}'
+              f'{h.sum / h.count * 1e6:>11.1f}{h.quantile(0.5) * 1e6:>10.1f}{h.quantile(0.99) * 1e6:>10.1f}')
+        if metrics.WRITE_STALL.get():
+            p(f'Waited for the writer: {metrics.WRITE_STALL.get():.3f} s')
+        if metrics.EVENTS_DROPPED.get():
+            p(f'UI events dropped: {metrics.EVENTS_DROPPED.get()}')
+
+        if self._snap:
+            self._report_mem(p)
+        if self._prof:
+            self._report_cpu(p)
+
+    def _report_mem(self, p):
+        import tracemalloc
+
+        snap = tracemalloc.take_snapshot()
+        cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        p(f'Memory: {cur / 1024:.0f} KiB traced, peak {peak / 1024:.0f} KiB, top growth:')
+        for s in snap.compare_to(self._snap, 'lineno')[:TOP]:
+            p(f'  {s}')
+
+    def _report_cpu(self, p):
+        import io
+        import pstats
+
+        st = pstats.Stats(self._prof, stream=io.StringIO())
+        for prof in self._profiles:
+            st.add(prof)
+        if self.cpu:
+            st.dump_stats(self.cpu)
+            p(f'CPU profile saved to {self.cpu}')
+        st.stream = self.out
+        st.sort_stats('cumulative').print_stats(TOP)
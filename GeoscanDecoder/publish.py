@@ -0,0 +1,222 @@
+import datetime as dt
+import json
+import selectors
+import socket as sk
+import threading
+
+from GeoscanDecoder.tlmlog import COLUMNS
+
+
+# Decoded frames for other local tools, one JSON object per line (TCP) or datagram (UDP):
+#   {"type": "tlm", "rx_time": ..., "time": ..., "Iab": ..., ..., "raw": "<hex>"}
+#   {"type": "img", "state": "progress" | "done", "name": ..., "received": ..., "size": ..., ...}
+
+
+def _json(o):
+    if isinstance(o, dt.datetime):
+        return o.isoformat()
+    raise TypeError(f'{type(o).__name__} is not JSON serializable')
+
+
+def tlm_event(data, tlm, rx_time=None):
+    ev = {'type': 'tlm', 'rx_time': rx_time or dt.datetime.utcnow()}
+    ev.update((k, tlm[k]) for k in COLUMNS if k not in ('rx_time', 'raw'))
+    ev['raw'] = bytes(data).hex()
+    return ev
+
+
+def img_event(img, x):
+    return {
+        'type': 'img',
+        'state': 'done' if x == 2 else 'progress',
+        'name': img.path.name,
+        'received': img.coverage.size,
+        'contiguous': img.coverage.prefix(),
+        'size': len(img.data),
+        'starter': bool(img.has_starter),
+        'soi': bool(img.has_soi),
+        'base_offset': img.base_offset,
+    }
+
+
+class _Client:
+    def __init__(self, sock, addr):
+        self.sk = sock
+        self.name = f'{addr[0]}:{addr[1]}'
+        self.buf = bytearray()
+        self.dropped = 0
+
+
+class Publisher(threading.Thread):
+    # TCP: serves any number of subscribers, every one has its own bounded buffer filled by
+    # publish() and drained by this thread; a slow subscriber loses messages, never stalls the
+    # decoder. UDP: every message is sent as a datagram to host:port (may be broadcast).
+    MAX_BUFFER = 0x40000
+
+    def __init__(self, host='127.0.0.1', port=8100, udp=False, max_buffer=MAX_BUFFER, log=None):
+        super().__init__(daemon=True)
+        self.addr = host, int(port)
+        self.udp = udp
+        self.max_buffer = max_buffer
+        self.log = log or (lambda msg: None)
+        self.clients = []
+        self.sent = 0
+        self.running = 1
+        self._lock = threading.Lock()
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = sk.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        if udp:
+            self.sock = sk.socket(sk.AF_INET, sk.SOCK_DGRAM)
+            self.sock.setsockopt(sk.SOL_SOCKET, sk.SO_BROADCAST, 1)
+            self.sock.setblocking(False)
+            return
+
+        self.sock = sk.socket(sk.AF_INET, sk.SOCK_STREAM)
+        self.sock.setsockopt(sk.SOL_SOCKET, sk.SO_REUSEADDR, 1)
+        self.sock.bind(self.addr)
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.addr = self.sock.getsockname()
+
+    @property
+    def active(self):
+        # lets the caller skip building events nobody receives
+        return self.udp or bool(self.clients)
+
+    def publish(self, ev):
+        line = json.dumps(ev, default=_json).encode() + b'\n'
+        if self.udp:
+            try:
+                self.sock.sendto(line, self.addr)
+                self.sent += 1
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if not self.clients:
+                return
+            for c in self.clients:
+                if len(c.buf) + len(line) > self.max_buffer:
+                    c.dropped += 1
+                else:
+                    c.buf += line
+            self.sent += 1
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            # the pipe is full, so the thread is going to wake up anyway
+            pass
+
+    def run(self):
+        if self.udp:
+            return
+
+        self._sel.register(self.sock, selectors.EVENT_READ)
+        self._sel.register(self._wake_r, selectors.EVENT_READ)
+        try:
+            while self.running:
+                for key, ev in self._sel.select(1.0):
+                    if key.fileobj is self.sock:
+                        self._accept()
+                    elif key.fileobj is self._wake_r:
+                        try:
+                            self._wake_r.recv(4096)
+                        except OSError:
+                            pass
+                    elif ev & selectors.EVENT_READ:
+                        self._read(key.data)
+                    else:
+                        self._send(key.data)
+                self._update()
+        finally:
+            self._sel.close()
+
+    def _accept(self):
+        try:
+            s, addr = self.sock.accept()
+        except OSError:
+            return
+        s.setblocking(False)
+        c = _Client(s, addr)
+        with self._lock:
+            self.clients.append(c)
+        self._sel.register(s, selectors.EVENT_READ, c)
+        self.log(f'Subscriber {c.name} connected')
+
+    def _read(self, c):
+        # subscribers aren't expected to send anything, so only a disconnect is of interest
+        try:
+            if c.sk.recv(4096):
+                return
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            pass
+        self._drop(c)
+
+    def _send(self, c):
+        # straight from the buffer, the socket doesn't block so the lock is held only for the copy
+        # to the kernel; the view is released before the buffer is shortened
+        with self._lock:
+            try:
+                with memoryview(c.buf) as v:
+                    n = c.sk.send(v)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                n = -1
+            else:
+                del c.buf[:n]
+        if n < 0:
+            self._drop(c)
+
+    def _update(self):
+        # wait for writability only while there is something to send
+        with self._lock:
+            clients = list(self.clients)
+        for c in clients:
+            ev = selectors.EVENT_READ | (selectors.EVENT_WRITE if c.buf else 0)
+            try:
+                if self._sel.get_key(c.sk).events != ev:
+                    self._sel.modify(c.sk, ev, c)
+            except (KeyError, ValueError):
+                pass
+
+    def _drop(self, c):
+        with self._lock:
+            if c in self.clients:
+                self.clients.remove(c)
+        try:
+            self._sel.unregister(c.sk)
+        except (KeyError, ValueError):
+            pass
+        c.sk.close()
+        self.log(f'Subscriber {c.name} disconnected' + (f', {c.dropped} messages dropped' if c.dropped else ''))
+
+    def close(self):
+        self.running = 0
+        self._wake()
+        if self.is_alive():
+            self.join()
+        for c in list(self.clients):
+            self._drop(c)
+        self.sock.close()
+        # run() closes the selector only if it served TCP
+        self._sel.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+def parse_address(s, default_port=8100):
+    # '[tcp|udp://]host[:port]' -> (host, port, udp)
+    udp = s.startswith('udp://')
+    s = s.split('://', 1)[-1]
+    host, _, port = s.rpartition(':') if ':' in s else (s, '', default_port)
+    return host or '127.0.0.1', int(port), udp
@@ -0,0 +1,211 @@
+import argparse
+import concurrent.futures
+import datetime as dt
+import os
+import pathlib
+import sys
+
+import construct
+
+from GeoscanDecoder.agwpe import AGWPEFramer
+from GeoscanDecoder.capture import is_capture, read_stream
+from GeoscanDecoder.dedup import DedupCache
+from GeoscanDecoder.geoscan import parse_tlm, GeoscanImageReceiver
+from GeoscanDecoder.tlmlog import make_row, read_log, TelemetryLog
+
+
+# Re-decodes archived frames: old per-beacon GEOSCAN_<time>.txt dumps, telemetry CSV logs
+# and capture files / raw AGWPE stream dumps. Work is split by file across processes and
+# merged back in input order, so the output doesn't depend on the number of jobs.
+
+TXT_BATCH = 256
+
+
+class _ArchiveImageReceiver(GeoscanImageReceiver):
+    # file names from the capture name instead of the wall clock, no idle expiry; one source
+    # decoded faster than real time, so a starter heard again is the image sent again
+    EOI_TIMEOUT = float('inf')
+    REPEAT_WINDOW = FINISHED_HOLD = 0
+
+    def __init__(self, outdir, prefix, merge_mode=0):
+        super().__init__(outdir, idle_timeout=float('inf'))
+        self.set_merge_mode(merge_mode)
+        self.prefix = prefix
+        self.done = []
+        self._n = 0
+
+    def generate_fid(self):
+        self._n += 1
+        return f'GEOSCAN_{self.prefix}_{self._n:03d}'
+
+    def finish(self, key):
+        img = super().finish(key)
+        if img and img.data:
+            self.done.append((img.path.name, img.report()))
+        return img
+
+
+def _parse(data):
+    try:
+        return parse_tlm(data)
+    except construct.ConstructError:
+        return
+
+
+def _is_txt(fp):
+    return fp.suffix == '.txt' and fp.name.startswith('GEOSCAN_')
+
+
+def _is_csv(fp):
+    return fp.suffix == '.csv' and fp.name.startswith(TelemetryLog.PREFIX)
+
+
+def _read_txt(fp):
+    # first line is the frame in hex, with or without spaces
+    with fp.open() as f:
+        return bytes.fromhex(f.readline().strip())
+
+
+def _decode_tlm_files(paths):
+    rows = []
+    for fp in map(pathlib.Path, paths):
+        if _is_csv(fp):
+            frames = ((r['raw'], r['rx_time']) for r in read_log(fp))
+        else:
+            try:
+                frames = [(_read_txt(fp), None)]
+            except (OSError, ValueError) as e:
+                print(f'{fp}: {e}', file=sys.stderr)
+                continue
+
+        for data, rx_time in frames:
+            tlm = _parse(data)
+            if tlm:
+                rx_time = rx_time or tlm.time
+                rows.append((rx_time, make_row(data, tlm, rx_time)))
+    return rows, []
+
+
+def _decode_capture(fp, outdir, prefix, merge_mode=0, dedup=False):
+    ir = _ArchiveImageReceiver(outdir, prefix, merge_mode)
+    dedup = DedupCache() if dedup else None
+    framer = AGWPEFramer()
+    rows = []
+    for t, chunk in read_stream(fp):
+        framer.feed(chunk)
+        for frame in framer.frames():
+            if frame.kind != b'K':
+                continue
+
+            data = bytes(frame.ax25)
+            # arrival times keep the dedup window independent of the decoding speed,
+            # raw dumps have none
+            if dedup is not None and t and not GeoscanImageReceiver.is_start(data) and dedup.seen(data, t):
+                continue
+
+            tlm = _parse(data)
+            if tlm:
+                rx_time = dt.datetime.utcfromtimestamp(t) if t else tlm.time
+                rows.append((rx_time, make_row(data, tlm, rx_time)))
+            ir.push_data(data)
+
+    ir.close()
+    return rows, ir.done
+
+
+def _run(task):
+    fn, args = task
+    return fn(*args)
+
+
+def collect(paths):
+    # input files in a stable order: arguments as given, directories sorted
+    out = []
+    for p in map(pathlib.Path, paths):
+        p = p.expanduser()
+        if not p.is_dir():
+            out.append(p)
+            continue
+
+        for fp in sorted(p.iterdir()):
+            if fp.is_file() and (_is_txt(fp) or _is_csv(fp) or is_capture(fp)):
+                out.append(fp)
+    return out
+
+
+def make_tasks(files, outdir, merge_mode=0, dedup=False):
+    tasks, txt, prefixes = [], [], set()
+    for fp in files:
+        if _is_txt(fp):
+            txt.append(str(fp))
+            if len(txt) >= TXT_BATCH:
+                tasks.append((_decode_tlm_files, (txt,)))
+                txt = []
+            continue
+
+        if txt:
+            tasks.append((_decode_tlm_files, (txt,)))
+            txt = []
+
+        if _is_csv(fp):
+            tasks.append((_decode_tlm_files, ([str(fp)],)))
+        else:
+            prefix = fp.stem
+            n = 1
+            while prefix in prefixes:
+                n += 1
+                prefix = f'{fp.stem}-{n}'
+            prefixes.add(prefix)
+            tasks.append((_decode_capture, (str(fp), str(outdir), prefix, merge_mode, dedup)))
+
+    if txt:
+        tasks.append((_decode_tlm_files, (txt,)))
+    return tasks
+
+
+def redecode(paths, outdir, jobs=None, merge_mode=0, dedup=False):
+    # returns (telemetry rows, [(image name, report), ...])
+    outdir = pathlib.Path(outdir).expanduser().absolute()
+    outdir.mkdir(parents=True, exist_ok=True)
+    tasks = make_tasks(collect(paths), outdir, merge_mode, dedup)
+
+    log = TelemetryLog(outdir)
+    n_rows, images = 0, []
+    executor = None
+    if jobs != 1 and len(tasks) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    try:
+        results = executor.map(_run, tasks) if executor else map(_run, tasks)
+        for rows, done in results:
+            for rx_time, row in rows:
+                log.write_row(rx_time, row)
+            n_rows += len(rows)
+            images.extend(done)
+    finally:
+        log.close()
+        if executor:
+            executor.shutdown()
+
+    return n_rows, images
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Decode archived frames again with the current decoder')
+    ap.add_argument('archive', nargs='+',
+                    help='GEOSCAN_*.txt, GEOSCAN_TLM_*.csv, capture or raw AGWPE dump files, or directories')
+    ap.add_argument('--outdir', required=True, help='Directory to store results, must not contain telemetry logs')
+    ap.add_argument('--jobs', type=int, default=os.cpu_count(), help='Worker processes, 1 - decode serially')
+    ap.add_argument('--merge', action='store_true', help='Store all images data of a capture to one file')
+    ap.add_argument('--dedup', action='store_true',
+                    help='Drop frames repeated within 2 minutes of arrival time (capture files only)')
+    args = ap.parse_args()
+
+    outdir = pathlib.Path(args.outdir).expanduser()
+    if outdir.is_dir() and any(outdir.glob(f'{TelemetryLog.PREFIX}*.csv')):
+        # the logs are appended to, so a second run would duplicate the rows
+        ap.error(f'{outdir} already contains telemetry logs')
+
+    n, images = redecode(args.archive, outdir, args.jobs, args.merge, args.dedup)
+    for name, report in images:
+        print(f'Image: {name} ({report})')
+    print(f'{n} telemetry frames, {len(images)} images')
@@ -0,0 +1,60 @@
+import time
+
+
+class RenderScheduler:
+    # Coalesces widget updates: set() only records the latest value of a field, changed
+    # fields are applied together at most `max_rate` times per second from the Tk loop,
+    # so the GUI cost doesn't depend on how many frames come in. max_rate 0 - no cap, the
+    # changes are still applied together on the next turn of the loop.
+    def __init__(self, widget, max_rate=10.0):
+        self.widget = widget
+        self.max_rate = max_rate
+        self._apply = {}
+        self._shown = {}
+        self._dirty = {}
+        self._job = None
+        self._last = 0
+
+    def register(self, key, apply, value=None):
+        # apply(value) updates the widget; `value` is what it shows now
+        self._apply[key] = apply
+        self._shown[key] = value
+
+    def set(self, key, value):
+        if self._shown.get(key, self) == value:
+            self._dirty.pop(key, None)
+            return
+        self._dirty[key] = value
+        self._schedule()
+
+    def update(self, values):
+        for k, v in values.items():
+            self.set(k, v)
+
+    def _schedule(self):
+        if self._job:
+            return
+        delay = self._last + 1 / self.max_rate - time.monotonic() if self.max_rate > 0 else 0
+        self._job = self.widget.after(max(int(delay * 1000), 0), self._run)
+
+    def _run(self):
+        self._job = None
+        self.flush()
+
+    def flush(self):
+        # apply the pending changes right now
+        if self._job:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        self._last = time.monotonic()
+
+        dirty, self._dirty = self._dirty, {}
+        for k, v in dirty.items():
+            self._apply[k](v)
+            self._shown[k] = v
+
+    def cancel(self):
+        if self._job:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        self._dirty.clear()
@@ -0,0 +1,136 @@
+import csv
+import datetime as dt
+import os
+import pathlib
+import threading
+
+from GeoscanDecoder.geoscan import geoscan_frame, MulAdapter, UNIXTimestampAdapter
+
+
+def _columns():
+    cols = {'rx_time': dt.datetime.fromisoformat}
+    for sc in geoscan_frame.subcons:
+        if sc.name == 'pad':
+            continue
+        if isinstance(sc.subcon, UNIXTimestampAdapter):
+            cols[sc.name] = dt.datetime.fromisoformat
+        elif isinstance(sc.subcon, MulAdapter):
+            cols[sc.name] = float
+        else:
+            cols[sc.name] = int
+    cols['raw'] = bytes.fromhex
+    return cols
+
+
+COLUMNS = _columns()
+
+
+def make_row(data, tlm, rx_time):
+    row = [rx_time]
+    row.extend(tlm[k] for k in COLUMNS if k not in ('rx_time', 'raw'))
+    row.append(bytes(data).hex())
+    return row
+
+
+class TelemetryLog:
+    # Rows are buffered and flushed every flush_rows rows. A timer started with the first
+    # buffered row flushes the rest flush_interval s later, so the tail of a burst doesn't
+    # wait for more telemetry. The methods may be called from any thread.
+    PREFIX = 'GEOSCAN_TLM_'
+
+    def __init__(self, outdir, flush_rows=16, flush_interval=5.0):
+        self.outdir = pathlib.Path(outdir).expanduser().absolute()
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.path = None
+        self._f = self._w = None
+        self._day = None
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def set_outdir(self, outdir):
+        with self._lock:
+            self.close()
+            self.outdir = pathlib.Path(outdir).expanduser().absolute()
+
+    @classmethod
+    def log_path(cls, outdir, day):
+        return outdir / f'{cls.PREFIX}{day}.csv'
+
+    def _open(self, day):
+        self.close()
+        self.outdir.mkdir(parents=True, exist_ok=True)
+        self.path = self.log_path(self.outdir, day)
+        new = not self.path.exists() or not self.path.stat().st_size
+        self._f = self.path.open('a', newline='')
+        self._w = csv.writer(self._f)
+        if new:
+            self._w.writerow(COLUMNS)
+        self._day = day
+
+    def write(self, data, tlm, rx_time=None):
+        rx_time = rx_time or dt.datetime.utcnow()
+        return self.write_row(rx_time, make_row(data, tlm, rx_time))
+
+    def write_row(self, rx_time, row):
+        day = rx_time.date()
+        with self._lock:
+            if day != self._day:
+                self._open(day)
+
+            self._w.writerow(row)
+
+            self._pending += 1
+            if self._pending >= self.flush_rows:
+                self.flush()
+            elif not self._timer:
+                # at most one timer thread per flush_interval, it isn't restarted by the flushes
+                self._timer = threading.Timer(self.flush_interval, self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+            return self.path
+
+    def _flush_due(self):
+        with self._lock:
+            self._timer = None
+            if self._pending:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._f:
+                self._f.flush()
+            self._pending = 0
+
+    def sync(self):
+        with self._lock:
+            self.flush()
+            if self._f:
+                os.fsync(self._f.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self._f:
+                self._f.close()
+            self._f = self._w = self._day = None
+            self._pending = 0
+
+
+def read_log(*paths):
+    # rows of telemetry logs as dicts; a directory stands for all its logs in date order
+    for p in paths:
+        p = pathlib.Path(p).expanduser()
+        files = sorted(p.glob(f'{TelemetryLog.PREFIX}*.csv')) if p.is_dir() else [p]
+        for fp in files:
+            with fp.open(newline='') as f:
+                r = csv.reader(f)
+                header = next(r, None)
+                if not header:
+                    continue
+                conv = [COLUMNS[k] for k in header]
+                for row in r:
+                    yield {k: c(v) for k, c, v in zip(header, conv, row)}
@@ -0,0 +1,165 @@
+import datetime as dt
+import pathlib
+import sqlite3
+import time
+
+from GeoscanDecoder.tlmlog import COLUMNS, read_log
+
+
+_EPOCH = dt.datetime(1970, 1, 1)
+# telemetry fields of `geoscan_frame`, times are stored as unix seconds
+FIELDS = [k for k in COLUMNS if k not in ('rx_time', 'time', 'raw')]
+_TIMES = ('time', 'rx_time')
+ROLLUP = 3600   # s, per-hour aggregates answer long range downsampling without touching every row
+
+
+def _ts(t):
+    return (t - _EPOCH).total_seconds()
+
+
+def _dt(ts):
+    return _EPOCH + dt.timedelta(seconds=ts)
+
+
+class TelemetryStore:
+    def __init__(self, path, batch=64, flush_interval=5.0):
+        self.path = pathlib.Path(path).expanduser().absolute()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch = batch
+        self.flush_interval = flush_interval
+        # the GUI decodes in a worker thread, callers serialize the access
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._create()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+        cols = ['time', 'rx_time'] + FIELDS + ['raw']
+        self._insert = f'INSERT INTO telemetry ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+
+    def _create(self):
+        with self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS telemetry ('
+                            f'id INTEGER PRIMARY KEY, time INTEGER NOT NULL, rx_time REAL NOT NULL, '
+                            f'{", ".join(f"{k} {_sql_type(k)}" for k in FIELDS)}, raw BLOB)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS telemetry_time ON telemetry (time)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS telemetry_rx_time ON telemetry (rx_time)')
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS telemetry_hourly (h INTEGER PRIMARY KEY, n INTEGER, '
+                            f'{", ".join(f"{k}_min, {k}_max, {k}_sum" for k in FIELDS)})')
+
+        aggs = ', '.join(f'MIN({k}), MAX({k}), SUM({k})' for k in FIELDS)
+        self._rollup = (f'INSERT OR REPLACE INTO telemetry_hourly '
+                        f'SELECT time / {ROLLUP}, COUNT(*), {aggs} FROM telemetry '
+                        f'WHERE time >= ? AND time < ? GROUP BY time / {ROLLUP}')
+        if not self.db.execute('SELECT 1 FROM telemetry_hourly LIMIT 1').fetchone():
+            with self.db:
+                self.db.execute(self._rollup, (-2 ** 62, 2 ** 62))
+
+    def write(self, data, tlm, rx_time=None):
+        rx_time = rx_time or dt.datetime.utcnow()
+        row = [int(_ts(tlm['time'])), _ts(rx_time)]
+        row.extend(tlm[k] for k in FIELDS)
+        row.append(bytes(data))
+        self._pending.append(row)
+
+        if len(self._pending) >= self.batch or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.db:
+                self.db.executemany(self._insert, self._pending)
+                for h in sorted({r[0] // ROLLUP for r in self._pending}):
+                    self.db.execute(self._rollup, (h * ROLLUP, (h + 1) * ROLLUP))
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def import_log(self, *paths):
+        # fill from telemetry CSV logs, returns the number of rows
+        n = 0
+        for r in read_log(*paths):
+            self.write(r['raw'], r, r['rx_time'])
+            n += 1
+        self.flush()
+        return n
+
+    @staticmethod
+    def _range(start, end, by):
+        if by not in _TIMES + ('h',):
+            raise ValueError(f'unknown time column: {by}')
+        where, args = [], []
+        if start is not None:
+            where.append(f'{by} >= ?')
+            args.append(_ts(start))
+        if end is not None:
+            where.append(f'{by} < ?')
+            args.append(_ts(end))
+        return (' WHERE ' + ' AND '.join(where)) if where else '', args
+
+    @staticmethod
+    def _check(fields):
+        for f in fields:
+            if f not in FIELDS:
+                raise ValueError(f'unknown field: {f}')
+
+    def query(self, start=None, end=None, fields=None, by='time', limit=None):
+        # rows as dicts in time order, [start, end) of satellite ('time') or receive ('rx_time') time
+        self.flush()
+        fields = list(fields or FIELDS)
+        self._check(fields)
+        where, args = self._range(start, end, by)
+        sql = f'SELECT time, rx_time, {", ".join(fields)} FROM telemetry{where} ORDER BY {by}'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+
+        for row in self.db.execute(sql, args):
+            r = dict(zip(['time', 'rx_time'] + fields, row))
+            r['time'] = _dt(r['time'])
+            r['rx_time'] = _dt(r['rx_time'])
+            yield r
+
+    def downsample(self, fields, step, start=None, end=None, by='time'):
+        # per `step` (timedelta or seconds) buckets: {'time': bucket start, 'n': rows,
+        # '<field>_min', '<field>_max', '<field>_mean': ...}
+        self.flush()
+        fields = [fields] if isinstance(fields, str) else list(fields)
+        self._check(fields)
+        step = step.total_seconds() if isinstance(step, dt.timedelta) else float(step)
+        where, args = self._range(start, end, by)
+
+        if by == 'time' and self._aligned(step, start, end):
+            where, args = self._range(start, end, 'h')
+            args = [a // ROLLUP for a in args]
+            aggs = ', '.join(f'MIN({f}_min), MAX({f}_max), CAST(SUM({f}_sum) AS REAL) / SUM(n)' for f in fields)
+            sql = (f'SELECT CAST(h * {ROLLUP} / ? AS INTEGER) AS b, SUM(n), {aggs} FROM telemetry_hourly{where} '
+                   f'GROUP BY b ORDER BY b')
+        else:
+            aggs = ', '.join(f'MIN({f}), MAX({f}), AVG({f})' for f in fields)
+            sql = (f'SELECT CAST({by} / ? AS INTEGER) AS b, COUNT(*), {aggs} FROM telemetry{where} '
+                   f'GROUP BY b ORDER BY b')
+
+        names = ['n']
+        for f in fields:
+            names.extend((f'{f}_min', f'{f}_max', f'{f}_mean'))
+        for row in self.db.execute(sql, [step] + args):
+            r = {'time': _dt(row[0] * step)}
+            r.update(zip(names, row[1:]))
+            yield r
+
+    @staticmethod
+    def _aligned(step, start, end):
+        if step % ROLLUP:
+            return False
+        return all(t is None or not _ts(t) % ROLLUP for t in (start, end))
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute('SELECT COUNT(*) FROM telemetry').fetchone()[0]
+
+
+def _sql_type(k):
+    return 'REAL' if COLUMNS[k] is float else 'INTEGER'
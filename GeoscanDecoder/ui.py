@@ -1,38 +1,44 @@
-import json
-import pathlib
 import re
 import socket as sk
-import sys
 import threading
 import tkinter as tk
-import urllib
-import urllib.error
-import urllib.request
 import queue
-import webbrowser
 
 from tkinter import ttk, filedialog, messagebox
 
 import PIL
 import PIL.Image
-import PIL.ImageFile
 import PIL.ImageTk
 
 from GeoscanDecoder import AGWPE_CON
-from GeoscanDecoder.geoscan import geoscan, GeoscanImageReceiver
+from GeoscanDecoder.capture import CaptureWriter
+from GeoscanDecoder.pipeline import Pipeline
+from GeoscanDecoder.preview import JpegPreview
+from GeoscanDecoder.render import RenderScheduler
+from GeoscanDecoder.worker import ReceiverThread
 from GeoscanDecoder.version import __version__
 
 
-PIL.ImageFile.LOAD_TRUNCATED_IMAGES = 1
-
-
 class App(ttk.Frame):
-    def __init__(self, config):
+    POLL_INTERVAL = 50     # ms
+    POLL_BATCH = 500
+    RENDER_RATE = 10       # Hz
+
+    def __init__(self, config, record=None, render_rate=RENDER_RATE, publish=None, postprocess=0,
+                 fsync='image', dedup=False):
         super().__init__()
 
         self.config = config
         self.sk = 0
-        self.ir = GeoscanImageReceiver(config.get('main', 'outdir'))
+        self.recorder = record and CaptureWriter(record)
+        self.worker = None
+        self.lock = threading.Lock()
+        self.pipeline = Pipeline(config.get('main', 'outdir'), db=config.get('main', 'db'), publish=publish,
+                                 postprocess=postprocess, fsync=fsync, dedup=dedup)
+        self.ir = self.pipeline.ir
+        self._cur_img = None
+        self.preview = JpegPreview()
+        self.render = RenderScheduler(self, render_rate)
 
         self.master.protocol("WM_DELETE_WINDOW", self.exit)
         self.master.option_add('*tearOff', tk.FALSE)
@@ -109,6 +115,9 @@ class App(ttk.Frame):
         self.new_btn = ttk.Button(self.ctrl_frame, text='New image', command=self.new_img)
         self.new_btn.grid(column=4, row=2, sticky=tk.EW, pady=3, padx=3)
 
+        self.queue_l = ttk.Label(self.ctrl_frame, text='Queue: 0')
+        self.queue_l.grid(column=0, columnspan=2, row=2, sticky=tk.W, pady=3)
+
         # tlm frame
         self.tlm_frame = ttk.LabelFrame(self, text='Telemetry', padding=(3, 3, 3, 3))
         self.tlm_frame.grid(column=1, row=1, sticky=tk.NSEW, padx=2, pady=2)
@@ -140,6 +149,15 @@ class App(ttk.Frame):
         self.tlm_name_l = ttk.Label(self.tlm_frame)
         self.tlm_name_l.grid(sticky=tk.EW, pady=3)
 
+        for k in self.tlm_table.get_children():
+            self.render.register(k, lambda v, k=k: self.tlm_table.set(k, 'val', v))
+        self.render.register('tlm_name', lambda v: self.tlm_name_l.config(text=v))
+        self.render.register('image_name', lambda v: self.image_name_l.config(text=v))
+        self.render.register('starter', lambda v: self.image_starter.config(foreground=v and 'green' or 'red'), 0)
+        self.render.register('soi', lambda v: self.image_soi.config(foreground=v and 'green' or 'red'), 0)
+        self.render.register('offset', self.image_offset_v.set, self.ir.BASE_OFFSET)
+        self.render.register('queue', lambda v: self.queue_l.config(text=v), 'Queue: 0')
+
         #####
         self.update()
         self.master.minsize(self.winfo_width(), self.winfo_height())
@@ -153,6 +171,10 @@ class App(ttk.Frame):
         self.config.set('main', 'outdir', self.out_dir_v.get())
         self.config.set('main', 'merge mode', str(self.merge_mode_v.get()))
 
+        with self.lock:
+            self.pipeline.close()
+        if self.recorder:
+            self.recorder.close()
         self.quit()
 
     def about(self, evt=None):
@@ -214,17 +236,17 @@ class App(ttk.Frame):
 
         ttk.Label(frame, text=links[0][0]).grid(column=0, row=4, sticky=tk.E)
         x = ttk.Label(frame, text=links[0][1], foreground='blue', cursor='hand2')
-        x.bind('<Button-1>', lambda e: webbrowser.open(links[0][1]))
+        x.bind('<Button-1>', lambda e: self.open_link(links[0][1]))
         x.grid(column=1, row=4, sticky=tk.W)
 
         ttk.Label(frame, text=links[1][0]).grid(column=0, row=5, sticky=tk.E)
         x = ttk.Label(frame, text=links[1][1], foreground='blue', cursor='hand2')
-        x.bind('<Button-1>', lambda e: webbrowser.open(links[1][1]))
+        x.bind('<Button-1>', lambda e: self.open_link(links[1][1]))
         x.grid(column=1, row=5, sticky=tk.W)
 
         ttk.Label(frame, text=links[2][0]).grid(column=0, row=6, sticky=tk.E)
         x = ttk.Label(frame, text=links[2][1], foreground='blue', cursor='hand2')
-        x.bind('<Button-1>', lambda e: webbrowser.open(links[2][1]))
+        x.bind('<Button-1>', lambda e: self.open_link(links[2][1]))
         x.grid(column=1, row=6, sticky=tk.W)
 
         about.update()
@@ -244,8 +266,19 @@ class App(ttk.Frame):
 
         about.update()
 
+    @staticmethod
+    def open_link(url):
+        import webbrowser
+
+        webbrowser.open(url)
+
     @staticmethod
     def check_updates(about, btns_frame):
+        # network modules are needed only here, don't load them at startup
+        import json
+        import urllib.error
+        import urllib.request
+
         m = re.match(r'([\d.]+).*', __version__)
         if m:
             v = tuple(map(int, m.group(1).split('.')))
@@ -304,15 +337,22 @@ class App(ttk.Frame):
             self.out_dir_btn.config(state=tk.DISABLED)
             self.update()
 
-            self.ir.set_outdir(self.out_dir_v.get())
-            self.ir.set_merge_mode(self.merge_mode_v.get())
-            try:
-                self._receive()
-            except Exception as e:
-                messagebox.showerror(message=str(e.args))
-                self._stop()
+            with self.lock:
+                self.pipeline.set_outdir(self.out_dir_v.get())
+                self.pipeline.set_merge_mode(self.merge_mode_v.get())
+
+            self.worker = ReceiverThread(self.sk, self.pipeline, self.lock,
+                                         tap=self.recorder and self.recorder.write)
+            self.worker.start()
+            self.after(self.POLL_INTERVAL, self._poll)
 
     def _stop(self):
+        if self.worker:
+            w = self.worker
+            self.worker = None
+            w.stop()
+            w.join()
+
         if self.sk:
             s = self.sk
             self.sk = 0
@@ -331,56 +371,70 @@ class App(ttk.Frame):
             self.out_dir_v.set(d)
 
     def set_merge_mode(self):
-        self.ir.set_merge_mode(self.merge_mode_v.get())
+        with self.lock:
+            self.pipeline.set_merge_mode(self.merge_mode_v.get())
 
-    def _receive(self):
-        cur_if = None
+    def _poll(self):
+        w = self.worker
+        if not w:
+            return
 
-        while self.sk:
+        img = None
+        done = 0
+        for _ in range(self.POLL_BATCH):
             try:
-                frame = self.sk.recv(4096)
-            except (sk.timeout, TimeoutError):
-                continue
-            finally:
-                self.update()
+                kind, val = w.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'tlm':
+                tlm, fn = val
+                self._fill_telemetry(tlm)
+                self.render.set('tlm_name', fn)
+
+            elif kind == 'img':
+                img = val
+                done |= img[0] == 2
+                if img[1]:
+                    self._cur_img = img[1]
+                    self.render.set('image_name', img[1].path.name)
 
-            if not frame:
+            elif kind == 'lost':
+                self._stop()
                 messagebox.showwarning(message='Connection lost')
+                return
+
+            elif kind == 'error':
                 self._stop()
+                messagebox.showerror(message=str(val.args))
                 return
 
-            data = frame[37:]
-            tlm = geoscan.parse(data)
-            if tlm.geoscan:
-                geo_tlm = tlm.geoscan
-                self._fill_telemetry(geo_tlm)
-                fp = pathlib.Path(self.out_dir_v.get()) / f'GEOSCAN_{geo_tlm.time}.txt'.replace(' ', '_').replace(':', '-')
-                self.tlm_name_l.config(text=fp.name)
-
-                with fp.open('w') as f:
-                    if sys.version_info < (3, 8, 0):
-                        f.write(data.hex())
-                    else:
-                        f.write(data.hex(' '))
-                    f.write('\n\n')
-                    f.write(str(geo_tlm))
-
-            x = self.ir.push_data(data)
-            if x:
-                if x == 1:
-                    f = self.ir.files.get(self.ir.current_fid)
-                    if f:
-                        cur_if = f
-                        self.image_name_l.config(text=pathlib.Path(f.name).name)
-                self._fill_canvas(cur_if)
-
-    def _fill_canvas(self, f):
-        self.image_starter.config(foreground=self.ir.has_starter and 'green' or 'red')
-        self.image_soi.config(foreground=self.ir.has_soi and 'green' or 'red')
-        self.image_offset_v.set(self.ir.base_offset)
-        i = None
+        if img:
+            self._fill_status(*img[2:])
+
+        # the preview decides itself whether enough new data came since the last repaint
+        if self._cur_img:
+            with self.lock:
+                data = self.preview.snapshot(self._cur_img, done)
+            if data:
+                self._fill_canvas(data)
+
+        depth = w.events.qsize()
+        text = f'Queue: {depth}' + (f' (dropped {w.dropped})' if w.dropped else '')
+        if self.pipeline.dedup is not None and self.pipeline.dedup.hits:
+            text += f'  Dup: {self.pipeline.dedup.hits}'
+        self.render.set('queue', text)
+        self.after(self.POLL_INTERVAL, self._poll)
+
+    def _fill_status(self, has_starter, has_soi, base_offset):
+        self.render.update({'starter': bool(has_starter), 'soi': bool(has_soi), 'offset': base_offset})
+
+    def _fill_canvas(self, data):
+        i = self.preview.decode(data)
+        if not i:
+            return
+
         try:
-            i = PIL.Image.open(f)
             if i.size != self.canvas_sz:
                 self.canvas.config(width=i.width, height=i.height)
                 self.canvas_sz = i.size
@@ -393,33 +447,17 @@ class App(ttk.Frame):
         except:
             pass
 
-        if i:
-            i.close()
+        i.close()
 
     def _fill_telemetry(self, tlm):
-        self.tlm_table.set('time', 'val', tlm.time)
-        self.tlm_table.set('Iab', 'val', tlm.Iab)
-        self.tlm_table.set('Isp', 'val', tlm.Isp)
-        self.tlm_table.set('Uab_per', 'val', tlm.Uab_per)
-        self.tlm_table.set('Uab_sum', 'val', tlm.Uab_sum)
-        self.tlm_table.set('Tx_plus', 'val', tlm.Tx_plus)
-        self.tlm_table.set('Tx_minus', 'val', tlm.Tx_minus)
-        self.tlm_table.set('Ty_plus', 'val', tlm.Ty_plus)
-        self.tlm_table.set('Ty_minus', 'val', tlm.Ty_minus)
-        self.tlm_table.set('Tz_plus', 'val', tlm.Tz_plus)
-        self.tlm_table.set('Tz_minus', 'val', tlm.Tz_minus)
-        self.tlm_table.set('Tab1', 'val', tlm.Tab1)
-        self.tlm_table.set('Tab2', 'val', tlm.Tab2)
-        self.tlm_table.set('CPU_load', 'val', tlm.CPU_load)
-        self.tlm_table.set('Nres_osc', 'val', tlm.Nres_osc)
-        self.tlm_table.set('Nres_CommU', 'val', tlm.Nres_CommU)
-        self.tlm_table.set('RSSI', 'val', tlm.RSSI)
+        # table rows are named after the telemetry fields
+        self.render.update({k: tlm[k] for k in self.tlm_table.get_children()})
 
     def new_img(self):
         self.canvas.delete(tk.ALL)
-        self.ir.force_new()
-        self.image_name_l.config(text=pathlib.Path(self.ir.files.get(self.ir.current_fid).name).name)
-
-        self.image_starter.config(foreground='red')
-        self.image_soi.config(foreground='red')
-        self.image_offset_v.set(self.ir.BASE_OFFSET)
+        with self.lock:
+            self.ir.force_new()
+            self._cur_img = self.ir.current_image
+        self.render.update({'image_name': self._cur_img.path.name,
+                            'starter': False, 'soi': False, 'offset': self.ir.BASE_OFFSET})
+        self.render.flush()
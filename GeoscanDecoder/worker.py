@@ -0,0 +1,73 @@
+import queue
+import socket as sk
+import threading
+
+from GeoscanDecoder import metrics
+from GeoscanDecoder.agwpe import AGWPEFramer
+
+
+class ReceiverThread(threading.Thread):
+    def __init__(self, sock, pipeline, lock, maxsize=256, tap=None):
+        super().__init__(daemon=True)
+        self.sk = sock
+        self.tap = tap
+        self.pipeline = pipeline
+        self.lock = lock
+        self.events = queue.Queue(maxsize)
+        self.dropped = 0
+        self.running = 1
+
+    def stop(self):
+        self.running = 0
+
+    def put(self, kind, value=None):
+        # never block on the consumer, the oldest event is dropped instead
+        while 1:
+            try:
+                self.events.put_nowait((kind, value))
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                    metrics.EVENTS_DROPPED.inc()
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        framer = AGWPEFramer(tap=self.tap)
+        metrics.QUEUE_DEPTH.set_function(self.events.qsize)
+        try:
+            while self.running:
+                try:
+                    n = framer.recv_into(self.sk)
+                except (sk.timeout, TimeoutError):
+                    with self.lock:
+                        self.pipeline.tick()
+                    continue
+
+                if not n:
+                    self.put('lost')
+                    return
+
+                with self.lock:
+                    for tlm, fp, x in self.pipeline.process_frames(framer):
+                        if tlm:
+                            self.put('tlm', (tlm, fp.name))
+                        if x:
+                            self.put('img', self._image_state(x))
+                # outside the lock, the GUI keeps running while the disk catches up
+                self.pipeline.wait_output()
+
+        except Exception as e:
+            if self.running:
+                self.put('error', e)
+
+        finally:
+            # the gauge would keep this thread's queue alive
+            metrics.QUEUE_DEPTH.set_function(None)
+
+    def _image_state(self, x):
+        ir = self.pipeline.ir
+        img = ir.last_image if x == 2 else ir.current_image
+        return x, img, ir.has_starter, ir.has_soi, ir.base_offset
@@ -0,0 +1,241 @@
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+from GeoscanDecoder import metrics
+from GeoscanDecoder.geoscan import CoverageMap
+
+
+# fsync points: never, when an image is finished (and on close), after every batch
+FSYNC = ('off', 'image', 'batch')
+PREALLOCATE = 0x10100   # image offsets are 16 bit, so no image is bigger
+MAX_BACKLOG = 0x400000  # bytes waiting to be written
+OP_COST = 256           # backlog bytes charged for a queued call or finish
+FALLOC_FL_KEEP_SIZE = 1
+
+_O_FLAGS = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+@functools.lru_cache(maxsize=None)
+def _fallocate():
+    # fallocate(2) of Linux; os.posix_fallocate() would change the file size, leaving
+    # a zero filled tail in an image cut short by a crash
+    if not sys.platform.startswith('linux'):
+        return
+    import ctypes
+
+    try:
+        fn = ctypes.CDLL(None, use_errno=True).fallocate
+    except (OSError, AttributeError):
+        return
+    fn.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    return fn
+
+
+def _preallocate(fd, size):
+    # reserve the space at once instead of growing the file chunk by chunk, the file size
+    # stays at what was written; a failure (file system without support) is of no matter
+    fn = _fallocate()
+    if fn:
+        fn(fd, FALLOC_FL_KEEP_SIZE, 0, size)
+
+
+class _Staged:
+    # image writes of one batch for one file, adjacent and overlapping chunks merged
+    def __init__(self):
+        self.buf = bytearray()
+        self.coverage = CoverageMap()
+
+    def write(self, offset, data):
+        end = offset + len(data)
+        if end > len(self.buf):
+            self.buf.extend(bytes(end - len(self.buf)))
+        self.buf[offset:end] = data
+        self.coverage.add(offset, end)
+
+
+class Writer(threading.Thread):
+    # Write-behind output: the decoder queues image chunks and telemetry writes, this thread
+    # applies them in batches. Queuing never blocks, so it is safe under the decoder locks;
+    # the decoder calls wait() between reads with no locks held, it blocks while the backlog
+    # (data bytes plus OP_COST per other op) is over `max_backlog` and the time is counted
+    # in `stalled`. A slow disk slows the reception down instead of losing frames.
+    def __init__(self, fsync='image', max_backlog=MAX_BACKLOG, preallocate=PREALLOCATE, log=None):
+        super().__init__(daemon=True)
+        if fsync not in FSYNC:
+            raise ValueError(f'unknown fsync mode: {fsync}')
+        self.fsync = fsync
+        self.max_backlog = max_backlog
+        self.preallocate = preallocate
+        self.log = log or (lambda msg: None)
+        # called on close and, with fsync='batch', after every batch to sync other files
+        self.sync_hooks = []
+        self.backlog = self.max_seen = 0
+        self.stalled = 0.0
+        self.batches = self.chunks = self.writes = self.errors = 0
+        self.running = 1
+        self._ops = collections.deque()
+        self._cond = threading.Condition()
+        self._files = {}
+        self._t_write = metrics.STAGE_TIME.labels(stage='write')
+        metrics.WRITE_BACKLOG.set_function(lambda: self.backlog)
+
+    @staticmethod
+    def _cost(op):
+        return len(op[3]) if op[0] == 'w' else OP_COST
+
+    def _put(self, op):
+        with self._cond:
+            self._ops.append(op)
+            self.backlog += self._cost(op)
+            self.max_seen = max(self.max_seen, self.backlog)
+            self._cond.notify_all()
+
+    @property
+    def behind(self):
+        return self.backlog > self.max_backlog
+
+    def wait(self, timeout=None):
+        # backpressure, returns False on timeout
+        with self._cond:
+            if self.backlog <= self.max_backlog or not self.is_alive():
+                return True
+            t = time.perf_counter()
+            ok = self._cond.wait_for(lambda: self.backlog <= self.max_backlog or not self.is_alive(), timeout)
+            t = time.perf_counter() - t
+            self.stalled += t
+            metrics.WRITE_STALL.inc(t)
+            return ok
+
+    def write(self, path, offset, data):
+        self._put(('w', path, offset, bytes(data)))
+
+    def finish(self, path, size, then=None):
+        # the file gets its final size; then() is called from this thread once it is written
+        self._put(('f', path, size, then))
+
+    def call(self, fn, *args):
+        # runs fn(*args) in order with the other writes
+        self._put(('c', fn, args))
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ops or not self.running)
+                if not self._ops:
+                    break
+                ops, self._ops = self._ops, collections.deque()
+
+            t = time.perf_counter()
+            size = self._apply(ops)
+            self._t_write.observe(time.perf_counter() - t)
+            with self._cond:
+                self.backlog -= size
+                self._cond.notify_all()
+
+        self._close_files()
+
+    def _close_files(self):
+        # images never finished keep what was written
+        for fd in self._files.values():
+            os.close(fd)
+        self._files.clear()
+
+    def _apply(self, ops):
+        size = 0
+        staged = {}
+        for op in ops:
+            size += self._cost(op)
+            if op[0] == 'w':
+                _, path, offset, data = op
+                staged.setdefault(path, _Staged()).write(offset, data)
+                self.chunks += 1
+            elif op[0] == 'f':
+                _, path, n, then = op
+                if path in staged:
+                    self._flush(path, staged.pop(path))
+                self._finish(path, n)
+                if then:
+                    self._call(then, ())
+            else:
+                self._call(op[1], op[2])
+
+        for path, st in staged.items():
+            self._flush(path, st)
+        if self.fsync == 'batch':
+            self._sync()
+        self.batches += 1
+        return size
+
+    def _flush(self, path, st):
+        try:
+            fd = self._files.get(path)
+            if fd is None:
+                fd = self._files[path] = os.open(str(path), _O_FLAGS, 0o644)
+                _preallocate(fd, self.preallocate)
+            for s, e in zip(st.coverage.starts, st.coverage.ends):
+                _pwrite(fd, st.buf[s:e], s)
+                self.writes += 1
+        except OSError as e:
+            self.errors += 1
+            self.log(f'Write to {path} failed: {e}')
+
+    def _finish(self, path, size):
+        fd = self._files.pop(path, None)
+        if fd is None:
+            return
+        try:
+            os.ftruncate(fd, size)
+            if self.fsync != 'off':
+                os.fsync(fd)
+        except OSError as e:
+            self.errors += 1
+            self.log(f'Write to {path} failed: {e}')
+        finally:
+            os.close(fd)
+
+    def _call(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errors += 1
+            self.log(f'Write-behind {getattr(fn, "__name__", fn)} failed: {e}')
+
+    def _sync(self):
+        for path, fd in self._files.items():
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                self.log(f'Sync of {path} failed: {e}')
+        for fn in self.sync_hooks:
+            self._call(fn, ())
+
+    def stats(self):
+        return (f'Writer: {self.chunks} chunks in {self.writes} writes, {self.batches} batches, '
+                f'max backlog {self.max_seen} bytes, stalled {self.stalled:.3f} s, {self.errors} errors')
+
+    def close(self):
+        # writes everything queued
+        with self._cond:
+            self.running = 0
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
+        elif self._ops:
+            # never started
+            ops, self._ops = self._ops, collections.deque()
+            self._apply(ops)
+            self._close_files()
+        if self.fsync != 'off':
+            self._sync()
+        metrics.WRITE_BACKLOG.set_function(None)
@@ -0,0 +1,92 @@
+from GeoscanDecoder.agwpe import AGWPE_HDR, AGWPEFramer
+
+
+def make_frame(data, kind=b'K', call_from=b'RS20S', call_to=b'BEACON'):
+    return AGWPE_HDR.pack(0, kind, 0xF0, call_from, call_to, len(data)) + data
+
+
+def collect(framer):
+    return [(f.kind, f.call_from, f.call_to, bytes(f.data)) for f in framer.frames()]
+
+
+def test_header_split():
+    raw = make_frame(b'\x00payload')
+    f = AGWPEFramer()
+    f.feed(raw[:10])
+    assert collect(f) == []
+    f.feed(raw[10:])
+    assert collect(f) == [(b'K', 'RS20S', 'BEACON', b'\x00payload')]
+    assert len(f) == 0
+
+
+def test_payload_split():
+    raw = make_frame(bytes(range(200)))
+    f = AGWPEFramer()
+    f.feed(raw[:AGWPE_HDR.size + 50])
+    assert collect(f) == []
+    f.feed(raw[AGWPE_HDR.size + 50:])
+    assert [d for *_, d in collect(f)] == [bytes(range(200))]
+
+
+def test_byte_by_byte():
+    raw = make_frame(b'abc') + make_frame(b'defg')
+    f = AGWPEFramer()
+    out = []
+    for i in range(len(raw)):
+        f.feed(raw[i:i + 1])
+        out.extend(collect(f))
+    assert [d for *_, d in out] == [b'abc', b'defg']
+
+
+def test_several_frames_in_one_read():
+    payloads = [b'one', b'two' * 10, b'three' * 100]
+    f = AGWPEFramer()
+    f.feed(b''.join(make_frame(p) for p in payloads) + make_frame(b'tail')[:5])
+    assert [d for *_, d in collect(f)] == payloads
+    assert len(f) == 5
+
+
+def test_zero_length_payload():
+    f = AGWPEFramer()
+    f.feed(make_frame(b'', kind=b'R') + make_frame(b'x'))
+    assert collect(f) == [(b'R', 'RS20S', 'BEACON', b''), (b'K', 'RS20S', 'BEACON', b'x')]
+
+
+def test_frame_bigger_than_buffer():
+    data = bytes(range(256)) * 40
+    f = AGWPEFramer(bufsize=256)
+    raw = make_frame(data)
+    for i in range(0, len(raw), 1000):
+        f.feed(raw[i:i + 1000])
+    assert [d for *_, d in collect(f)] == [data]
+
+
+def test_desync_drops_buffer():
+    f = AGWPEFramer()
+    f.feed(AGWPE_HDR.pack(0, b'K', 0, b'', b'', AGWPEFramer.MAX_DATA_LEN + 1) + b'junk')
+    assert collect(f) == []
+    assert f.errors == 1
+    assert len(f) == 0
+
+
+class FakeSocket:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, buf):
+        data = self.chunks.pop(0)
+        buf[:len(data)] = data
+        return len(data)
+
+
+def test_recv_into_and_tap():
+    raw = make_frame(b'abc') + make_frame(b'def')
+    tapped = []
+    f = AGWPEFramer(tap=lambda b: tapped.append(bytes(b)))
+    sock = FakeSocket([raw[:7], raw[7:40], raw[40:]])
+    out = []
+    for _ in range(3):
+        f.recv_into(sock)
+        out.extend(collect(f))
+    assert [d for *_, d in out] == [b'abc', b'def']
+    assert b''.join(tapped) == raw
@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from GeoscanDecoder.bench import make_agwpe, make_chunks, make_jpeg, make_tlm
+from GeoscanDecoder.capture import CaptureWriter
+from GeoscanDecoder.dedup import DedupCache
+from GeoscanDecoder.pipeline import Pipeline
+from GeoscanDecoder.redecode import redecode
+
+
+def test_seen_within_ttl():
+    d = DedupCache(ttl=10)
+    assert not d.seen(b'abc', 100.0)
+    assert d.seen(b'abc', 105.0)
+    assert not d.seen(b'abd', 105.0)
+    assert (d.hits, d.misses) == (1, 2)
+
+
+def test_expire_after_ttl():
+    d = DedupCache(ttl=10)
+    d.seen(b'abc', 100.0)
+    d.seen(b'abd', 105.0)
+    d.expire(110.0)
+    assert len(d) == 1
+    assert not d.seen(b'abc', 110.0)
+    assert d.seen(b'abd', 114.0)
+    # the repeat doesn't renew the entry
+    assert not d.seen(b'abd', 115.0)
+
+
+def test_eviction():
+    d = DedupCache(max_entries=3, ttl=1000)
+    for i in range(5):
+        d.seen(bytes([i]), 100.0 + i)
+    assert len(d) == 3
+    # the oldest are evicted
+    assert not d.seen(b'\x00', 105.0)
+    assert d.seen(b'\x04', 105.0)
+
+
+def test_pipeline_dedup(tmp_path):
+    rnd = random.Random(1)
+    tlm = make_tlm(1690000000, rnd)
+    chunks = make_chunks(make_jpeg(rnd, (64, 48)))
+
+    p = Pipeline(tmp_path, dedup=True, write_behind=False)
+    try:
+        assert p.process(tlm)[0]
+        assert not p.process(tlm)[0]
+        assert p.process(chunks[0])[2]
+        assert p.process(chunks[1])[2]
+        assert not p.process(chunks[1])[2]
+        # the image is sent again, its starter passes
+        assert p.process(chunks[0])[2]
+        assert p.dedup.hits == 2
+    finally:
+        p.close()
+
+
+def test_pipeline_dedup_off(tmp_path):
+    rnd = random.Random(1)
+    tlm = make_tlm(1690000000, rnd)
+
+    p = Pipeline(tmp_path, write_behind=False)
+    try:
+        assert p.dedup is None
+        assert p.process(tlm)[0]
+        assert p.process(tlm)[0]
+    finally:
+        p.close()
+
+
+def lagged(chunks, lost_a=(), lost_b=(), lag=2):
+    for i in range(len(chunks) + lag):
+        if i < len(chunks) and i not in lost_a:
+            yield chunks[i]
+        j = i - lag
+        if j >= 0 and j not in lost_b:
+            yield chunks[j]
+
+
+@pytest.mark.parametrize('lost_a, lost_b', [((), ()), ((10,), (1,)), ((0,), ())])
+def test_pipeline_dedup_lagged(tmp_path, lost_a, lost_b):
+    # two soundmodems, the second one two frames behind
+    jpg = make_jpeg(random.Random(1), (64, 48))
+    chunks = make_chunks(jpg, base=2000)
+    p = Pipeline(tmp_path, dedup=True, write_behind=False)
+    try:
+        for c in lagged(chunks, lost_a, lost_b):
+            p.process(c)
+    finally:
+        p.close()
+    assert [fp.read_bytes() == jpg for fp in tmp_path.glob('*.jpg')] == [True]
+
+
+def test_redecode_dedup(tmp_path):
+    ax25 = make_agwpe(make_tlm(1690000000, random.Random(1)))
+    cap = CaptureWriter(tmp_path / 'pass.cap')
+    cap.write(ax25, 1690000000.0)
+    cap.write(ax25, 1690000001.0)
+    cap.write(ax25, 1690000200.0)
+    cap.close()
+    (tmp_path / 'pass.agw').write_bytes(ax25 * 3)
+
+    assert redecode([tmp_path / 'pass.cap'], tmp_path / 'a', jobs=1)[0] == 3
+    assert redecode([tmp_path / 'pass.cap'], tmp_path / 'b', jobs=1, dedup=True)[0] == 2
+    # no arrival times in a raw dump, nothing to tell a repeat by
+    assert redecode([tmp_path / 'pass.agw'], tmp_path / 'c', jobs=1, dedup=True)[0] == 3
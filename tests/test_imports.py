@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+from GeoscanDecoder.bench import import_time
+
+
+# cold import of the console is ~0.1 s, the margin is for a slow or busy machine
+MAX_IMPORT_MS = 1000
+
+
+def test_console_import_is_light():
+    # the console must start without the GUI stack, and PIL is only needed for post-processing
+    code = ('import sys, GeoscanDecoder.console; '
+            'print(" ".join(m for m in ("tkinter", "PIL") if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True, text=True)
+    assert out.stdout.strip() == ''
+
+
+def test_console_import_time():
+    t = import_time('GeoscanDecoder.console', repeat=3)
+    assert t is not None
+    assert t < MAX_IMPORT_MS
@@ -0,0 +1,53 @@
+import argparse
+import configparser
+import random
+
+import pytest
+
+from GeoscanDecoder.bench import make_chunks, make_jpeg
+from GeoscanDecoder.console import Console
+from GeoscanDecoder.ingest import parse_endpoints
+from GeoscanDecoder.pipeline import Pipeline
+
+
+def test_parse_endpoints():
+    assert parse_endpoints('') == []
+    assert parse_endpoints('a:8001, b ; c:, ') == [('a', 8001), ('b', 8000), ('c', 8000)]
+    assert parse_endpoints('c:', default_port=9000) == [('c', 9000)]
+
+
+@pytest.mark.parametrize('s', ['host:abc', 'a:1,b:x', ':8000', 'host:0', 'host:65536'])
+def test_parse_endpoints_bad(s):
+    with pytest.raises(argparse.ArgumentTypeError, match='endpoint'):
+        parse_endpoints(s)
+
+
+def test_replay_not_recorded(tmp_path):
+    cp = configparser.ConfigParser()
+    cp.read_dict({'main': {'ip': '127.0.0.1', 'port': '8000', 'servers': '', 'outdir': str(tmp_path),
+                           'merge mode': 'off', 'db': ''}})
+    with pytest.raises(ValueError):
+        Console(cp, record=tmp_path / 'rec.cap', replay=tmp_path / 'pass.cap')
+    assert not (tmp_path / 'rec.cap').exists()
+
+
+def two_stations(chunks, lost_a, lost_b, lag=2):
+    # the same image heard by two soundmodems with different losses, the second one behind
+    for i in range(len(chunks) + lag):
+        if i < len(chunks) and i not in lost_a:
+            yield chunks[i]
+        j = i - lag
+        if j >= 0 and j not in lost_b:
+            yield chunks[j]
+
+
+def test_two_stations(tmp_path):
+    jpg = make_jpeg(random.Random(1), (64, 48))
+    chunks = make_chunks(jpg, base=2000)
+    p = Pipeline(tmp_path, write_behind=False)
+    try:
+        done = [x for x in (p.process(c)[2] for c in two_stations(chunks, {10}, {1})) if x == 2]
+    finally:
+        p.close()
+    assert len(done) == 1
+    assert [fp.read_bytes() == jpg for fp in tmp_path.glob('*.jpg')] == [True]
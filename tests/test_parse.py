@@ -0,0 +1,61 @@
+import random
+import timeit
+
+import construct
+import pytest
+
+from GeoscanDecoder.bench import make_chunks, make_header, make_tlm
+from GeoscanDecoder.geoscan import _frame, geoscan, parse_frame, parse_tlm
+
+
+def frames(n=500, seed=1):
+    rnd = random.Random(seed)
+    return [make_tlm(1690000000 + rnd.randrange(10 ** 8), rnd) for _ in range(n)]
+
+
+def test_parse_tlm_matches_construct():
+    for data in frames():
+        ref = geoscan.parse(data).geoscan
+        fast = parse_tlm(data)
+        for k in ref:
+            if k.startswith('_'):
+                continue
+            assert fast[k] == ref[k], k
+
+
+def test_parse_tlm_truncated():
+    data = frames(1)[0]
+    with pytest.raises(construct.StreamError):
+        parse_tlm(data[:30])
+    with pytest.raises(construct.StreamError):
+        geoscan.parse(data[:30])
+
+
+def test_parse_tlm_not_beacon():
+    data = frames(1)[0]
+    assert parse_tlm(make_header(dst='RS20S') + data[16:]) is None
+    assert parse_tlm(data[:5]) is None
+
+
+def test_parse_frame_matches_construct():
+    rnd = random.Random(2)
+    jpg = bytes(rnd.randrange(256) for _ in range(1000))
+    chunks = make_chunks(jpg)
+    for data in chunks:
+        ref = _frame.parse(data)
+        fast = parse_frame(data)
+        for k in ('marker', 'dlen', 'mtype', 'offset', 'subsystem_num', 'data'):
+            assert fast[k] == ref[k], k
+    for data in (b'\x01\x00\x10', chunks[0][:20]):
+        with pytest.raises(construct.StreamError):
+            _frame.parse(data)
+        with pytest.raises(construct.StreamError):
+            parse_frame(data)
+
+
+def test_parse_tlm_faster():
+    # the whole point of the fast path, with a wide margin against a noisy machine
+    data = frames(50)
+    fast = min(timeit.repeat(lambda: [parse_tlm(d) for d in data], number=5, repeat=3))
+    ref = min(timeit.repeat(lambda: [geoscan.parse(d) for d in data], number=5, repeat=3))
+    assert fast * 3 < ref
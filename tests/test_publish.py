@@ -0,0 +1,64 @@
+import json
+import socket
+import time
+
+from GeoscanDecoder.publish import Publisher
+
+
+def wait_for(cond, timeout=5):
+    t = time.monotonic() + timeout
+    while not cond() and time.monotonic() < t:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_tcp():
+    p = Publisher(port=0)
+    p.start()
+    s = socket.create_connection(p.addr)
+    try:
+        assert wait_for(lambda: p.clients)
+        evs = [{'type': 'img', 'n': i, 'pad': 'x' * 1000} for i in range(200)]
+        for ev in evs:
+            p.publish(ev)
+
+        data = b''
+        s.settimeout(5)
+        while data.count(b'\n') < len(evs):
+            data += s.recv(0x10000)
+        assert [json.loads(x) for x in data.splitlines()] == evs
+        assert wait_for(lambda: not p.clients[0].buf)
+    finally:
+        s.close()
+        p.close()
+    assert p._sel.get_map() is None
+
+
+def test_slow_subscriber():
+    p = Publisher(port=0, max_buffer=4096)
+    p.start()
+    s = socket.create_connection(p.addr)
+    try:
+        assert wait_for(lambda: p.clients)
+        for i in range(2000):
+            p.publish({'type': 'img', 'n': i, 'pad': 'x' * 1000})
+        assert p.clients[0].dropped
+        assert len(p.clients[0].buf) <= 4096
+    finally:
+        s.close()
+        p.close()
+
+
+def test_udp_close():
+    r = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    r.bind(('127.0.0.1', 0))
+    r.settimeout(5)
+    p = Publisher(*r.getsockname(), udp=True)
+    p.start()
+    p.publish({'type': 'tlm', 'n': 1})
+    assert json.loads(r.recv(4096)) == {'type': 'tlm', 'n': 1}
+    r.close()
+
+    p.close()
+    assert p._sel.get_map() is None
+    assert p._wake_r.fileno() == -1 and p._wake_w.fileno() == -1
@@ -0,0 +1,90 @@
+import random
+
+import construct
+
+from GeoscanDecoder.bench import make_chunks, make_jpeg
+from GeoscanDecoder.geoscan import GeoscanImageReceiver, _frame
+from GeoscanDecoder.writer import Writer
+
+
+def frame(offset, data, subsystem=1, mtype=GeoscanImageReceiver.CMD_IMG_FRAME):
+    return _frame.build(construct.Container(
+        marker=GeoscanImageReceiver.MARKER_IMG, dlen=len(data) + 6, mtype=mtype,
+        offset=offset, subsystem_num=subsystem, data=data))
+
+
+def test_chunk_before_moved_base(tmp_path):
+    ir = GeoscanImageReceiver(tmp_path)
+    assert ir.push_data(frame(1100, b'\x11' * 56)) == 1
+    assert ir.push_data(frame(900, b'\x55' * 56)) == 1
+    img = ir.current_image
+    assert img.key == (1, 0)
+
+    # the image start comes later, the base moves to it with the data before it dropped
+    assert ir.push_data(frame(1000, b'\xff\xd8' + b'\x22' * 54)) == 1
+    assert ir.current_image is img
+    assert img.key == (1, 1000) and img.base_offset == 1000
+    assert img.data[100:156] == b'\x11' * 56
+    assert img.data[:56] == b'\xff\xd8' + b'\x22' * 54
+    assert list(zip(img.coverage.starts, img.coverage.ends)) == [(0, 56), (100, 156)]
+    assert img.missing() == [(56, 100)]
+
+    # an earlier chunk gets a session of its own, the image in progress stays
+    assert ir.push_data(frame(500, b'\x33' * 56)) == 1
+    assert ir.current_image is not img
+    assert ir.sessions[(1, 1000)] is img
+    assert ir.last_image is None
+
+    assert ir.push_data(frame(1056, b'\x44' * 56)) == 1
+    assert ir.current_image is img
+    assert img.data[56:112] == b'\x44' * 56
+    assert not img.missing()
+    ir.close()
+
+
+def test_moved_base_written(tmp_path):
+    w = Writer(fsync='off')
+    w.start()
+    ir = GeoscanImageReceiver(tmp_path)
+    ir.writer = w
+    ir.push_data(frame(1100, b'\x11' * 56))
+    ir.push_data(frame(1000, b'\xff\xd8' + b'\x22' * 54))
+    img = ir.current_image
+    ir.close()
+    w.close()
+    assert img.path.read_bytes() == bytes(img.data)
+    assert len(img.data) == 156
+
+
+def test_starter_resent(tmp_path):
+    chunks = make_chunks(make_jpeg(random.Random(1), (64, 48)), base=2000)
+    ir = GeoscanImageReceiver(tmp_path)
+    for c in chunks[:3]:
+        ir.push_data(c)
+    img = ir.current_image
+
+    # heard again soon, e.g. by another soundmodem: the same reception
+    ir.push_data(chunks[0])
+    assert ir.current_image is img and ir.last_image is None
+
+    # the same image sent again later finishes the first reception
+    img.created -= ir.REPEAT_WINDOW
+    ir.push_data(chunks[0])
+    assert ir.last_image is img
+    assert ir.current_image is not img
+    assert ir.current_image.key == (1, 2000)
+    ir.close()
+
+
+def test_subsystems_apart(tmp_path):
+    jpg = make_jpeg(random.Random(1), (64, 48))
+    a = make_chunks(jpg, base=2000, subsystem=1)
+    b = make_chunks(jpg, base=2000, subsystem=2)
+    ir = GeoscanImageReceiver(tmp_path)
+    done = []
+    ir.on_finish = done.append
+    for x, y in zip(a, b):
+        ir.push_data(x)
+        ir.push_data(y)
+    assert [img.key for img in done] == [(1, 2000), (2, 2000)]
+    assert all(img.data == jpg for img in done)
@@ -0,0 +1,39 @@
+import pytest
+
+from GeoscanDecoder.render import RenderScheduler
+
+
+class FakeWidget:
+    def __init__(self):
+        self.jobs = []
+
+    def after(self, ms, fn):
+        self.jobs.append((ms, fn))
+        return len(self.jobs)
+
+    def after_cancel(self, job):
+        pass
+
+    def run(self):
+        jobs, self.jobs = self.jobs, []
+        for ms, fn in jobs:
+            fn()
+        return [ms for ms, fn in jobs]
+
+
+@pytest.mark.parametrize('rate', [0, 10.0])
+def test_coalesced(rate):
+    w = FakeWidget()
+    shown = []
+    r = RenderScheduler(w, rate)
+    r.register('a', shown.append)
+    for i in range(5):
+        r.set('a', i)
+    assert len(w.jobs) == 1
+    w.run()
+    assert shown == [4]
+
+    r.set('a', 5)
+    delay = w.run()
+    assert shown == [4, 5]
+    assert (delay[0] == 0) == (not rate)
@@ -0,0 +1,61 @@
+import datetime as dt
+import random
+import threading
+import time
+
+from GeoscanDecoder.bench import make_tlm
+from GeoscanDecoder.geoscan import parse_tlm
+from GeoscanDecoder.tlmlog import read_log, TelemetryLog
+
+
+def rows(n, seed=1):
+    rnd = random.Random(seed)
+    for i in range(n):
+        data = make_tlm(1690000000 + i, rnd)
+        yield data, parse_tlm(data)
+
+
+def test_flush_after_burst(tmp_path):
+    log = TelemetryLog(tmp_path, flush_rows=100, flush_interval=0.05)
+    rx_time = dt.datetime(2023, 7, 1, 12)
+    for data, tlm in rows(3):
+        path = log.write(data, tlm, rx_time)
+    assert not list(read_log(path))
+
+    # no more rows come, the timer flushes the buffered ones
+    for _ in range(100):
+        time.sleep(0.01)
+        if len(list(read_log(path))) == 3:
+            break
+    assert len(list(read_log(path))) == 3
+    assert log._timer is None
+    log.close()
+
+
+def test_flush_rows(tmp_path):
+    log = TelemetryLog(tmp_path, flush_rows=4, flush_interval=60)
+    rx_time = dt.datetime(2023, 7, 1, 12)
+    for data, tlm in rows(5):
+        path = log.write(data, tlm, rx_time)
+    assert len(list(read_log(path))) == 4
+    log.close()
+    assert len(list(read_log(path))) == 5
+    assert log._timer is None
+
+
+def test_threads(tmp_path):
+    log = TelemetryLog(tmp_path, flush_rows=7, flush_interval=0.001)
+    rx_time = dt.datetime(2023, 7, 1, 12)
+    frames = list(rows(50))
+
+    def run():
+        for data, tlm in frames:
+            log.write(data, tlm, rx_time)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.close()
+    assert len(list(read_log(TelemetryLog.log_path(log.outdir, rx_time.date())))) == 200
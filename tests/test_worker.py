@@ -0,0 +1,23 @@
+import random
+import socket
+import threading
+
+from GeoscanDecoder import metrics
+from GeoscanDecoder.bench import make_agwpe, make_tlm
+from GeoscanDecoder.pipeline import Pipeline
+from GeoscanDecoder.worker import ReceiverThread
+
+
+def test_queue_gauge_released(tmp_path):
+    a, b = socket.socketpair()
+    p = Pipeline(tmp_path, write_behind=False)
+    w = ReceiverThread(b, p, threading.Lock())
+    w.start()
+    a.sendall(make_agwpe(make_tlm(1690000000, random.Random(1))))
+    a.close()
+    w.join(5)
+    b.close()
+    p.close()
+
+    assert [k for k, v in list(w.events.queue)] == ['tlm', 'lost']
+    assert metrics.QUEUE_DEPTH.get() == metrics.QUEUE_DEPTH.value
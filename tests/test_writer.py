@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+import pytest
+
+from GeoscanDecoder import writer as writer_mod
+from GeoscanDecoder.writer import OP_COST, Writer
+
+
+def test_coalesce_and_finish(tmp_path):
+    fp = tmp_path / 'img.jpg'
+    w = Writer(fsync='off')
+    done = []
+    # not started yet, so all of it goes in one batch
+    for off in (112, 0, 56, 300):
+        w.write(fp, off, bytes([off % 251]) * 56)
+    w.write(fp, 10, b'x' * 4)
+    w.finish(fp, 356, lambda: done.append(fp.stat().st_size))
+    w.start()
+    w.close()
+
+    data = fp.read_bytes()
+    assert len(data) == 356 and done == [356]
+    assert data[:10] == bytes(10) and data[10:14] == b'xxxx' and data[14:56] == bytes(42)
+    assert data[56:112] == bytes([56]) * 56 and data[168:300] == bytes(132)
+    assert w.writes == 2        # 0..168 merged, 300..356
+
+
+def test_unfinished_file_keeps_written_size(tmp_path):
+    fp = tmp_path / 'img.jpg'
+    w = Writer(fsync='off')
+    w.start()
+    w.write(fp, 0, b'a' * 100)
+    w.close()
+    assert fp.stat().st_size == 100
+
+
+def test_calls_count_towards_backlog():
+    w = Writer()
+    for _ in range(10):
+        w.call(lambda: None)
+    assert w.backlog == 10 * OP_COST
+    w.start()
+    w.close()
+    assert w.backlog == 0
+
+
+def test_backpressure(tmp_path, monkeypatch):
+    gate = threading.Event()
+    apply = Writer._apply
+
+    def slow(self, ops):
+        gate.wait()
+        return apply(self, ops)
+
+    monkeypatch.setattr(Writer, '_apply', slow)
+    w = Writer(fsync='off', max_backlog=1000)
+    w.start()
+    for i in range(40):
+        # queuing never blocks, even far over the limit
+        w.write(tmp_path / 'img.jpg', i * 56, bytes(56))
+    assert w.behind
+    assert not w.wait(0.05)
+    threading.Timer(0.05, gate.set).start()
+    t = time.perf_counter()
+    assert w.wait(5)
+    assert time.perf_counter() - t >= 0.03
+    assert w.stalled > 0
+    w.close()
+
+
+def test_writes_preallocated_without_size_change(tmp_path):
+    if not writer_mod._fallocate():
+        pytest.skip('fallocate(2) is not available')
+    fp = tmp_path / 'img.jpg'
+    fd = os.open(str(fp), os.O_RDWR | os.O_CREAT)
+    writer_mod._preallocate(fd, 0x10000)
+    os.close(fd)
+    assert fp.stat().st_size == 0